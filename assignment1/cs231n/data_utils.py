@@ -1,20 +1,41 @@
 import cPickle as pickle
 import numpy as np
+import itertools
+import multiprocessing
 import os
 from scipy.misc import imread
 
-def load_CIFAR_batch(filename):
-  """ load single batch of cifar """
+PACKED_CIFAR10_FILE = 'cifar10_uint8.bin'
+PACKED_CIFAR10_MAGIC = 'CIFAR10\0'
+PACKED_CIFAR10_HEADER_SIZE = 64
+
+
+def load_CIFAR_batch(filename, dtype="float"):
+  """ load single batch of cifar; pass dtype=None to keep the raw uint8 pixels """
   with open(filename, 'rb') as f:
     datadict = pickle.load(f)
     X = datadict['data']
     Y = datadict['labels']
-    X = X.reshape(10000, 3, 32, 32).transpose(0,2,3,1).astype("float")
+    X = X.reshape(10000, 3, 32, 32).transpose(0,2,3,1)
+    if dtype is not None:
+      X = X.astype(dtype)
     Y = np.array(Y)
     return X, Y
 
-def load_CIFAR10(ROOT):
-  """ load all of cifar """
+def load_CIFAR10(ROOT, packed=False):
+  """
+  load all of cifar
+
+  If packed is True, the batches are converted once into a single uint8 file
+  inside ROOT (see pack_CIFAR10) and every later call memory-maps that file
+  instead of unpickling; the returned images are then read-only uint8 arrays.
+  """
+  if packed:
+    filename = os.path.join(ROOT, PACKED_CIFAR10_FILE)
+    if not os.path.isfile(filename):
+      pack_CIFAR10(ROOT, filename)
+    return load_CIFAR10_packed(filename)
+
   xs = []
   ys = []
   for b in range(1,6):
@@ -28,7 +49,170 @@ def load_CIFAR10(ROOT):
   Xte, Yte = load_CIFAR_batch(os.path.join(ROOT, 'test_batch'))
   return Xtr, Ytr, Xte, Yte
 
-def load_tiny_imagenet(path, dtype=np.float32):
+
+def pack_CIFAR10(ROOT, filename):
+  """
+  Convert the pickled CIFAR-10 batches in ROOT into a single binary file that
+  load_CIFAR10_packed can memory-map.
+
+  The file starts with a 64 byte header holding a magic string followed by
+  little-endian int64 values (version, num_train, num_test, H, W, C). It is
+  followed by all images as uint8 in (N, H, W, C) order, training images
+  first, and then by all labels as uint8.
+
+  Inputs:
+  - ROOT: Directory containing the cifar-10-batches-py files.
+  - filename: Path of the packed file to write.
+  """
+  batch_files = [os.path.join(ROOT, 'data_batch_%d' % (b, )) for b in range(1, 6)]
+  batch_files.append(os.path.join(ROOT, 'test_batch'))
+
+  # Write to a temporary file first so that a crash never leaves behind a
+  # truncated file that looks valid
+  tmp_filename = filename + '.tmp'
+  ys = []
+  with open(tmp_filename, 'wb') as f:
+    f.write('\0' * PACKED_CIFAR10_HEADER_SIZE)
+    for batch_file in batch_files:
+      X, Y = load_CIFAR_batch(batch_file, dtype=None)
+      f.write(np.ascontiguousarray(X).tostring())
+      ys.append(Y)
+    f.write(np.concatenate(ys).astype(np.uint8).tostring())
+
+    num_train = sum(Y.shape[0] for Y in ys[:-1])
+    num_test = ys[-1].shape[0]
+    header = np.array((1, num_train, num_test) + X.shape[1:], dtype='<i8')
+    f.seek(0)
+    f.write(PACKED_CIFAR10_MAGIC + header.tostring())
+  os.rename(tmp_filename, filename)
+
+
+def load_CIFAR10_packed(filename):
+  """
+  Memory-map a file written by pack_CIFAR10. Nothing is read from disk until
+  the returned images are accessed.
+
+  Returns a tuple of:
+  - Xtr: Read-only uint8 array of shape (num_train, H, W, C)
+  - Ytr: Array of shape (num_train,) giving training labels
+  - Xte: Read-only uint8 array of shape (num_test, H, W, C)
+  - Yte: Array of shape (num_test,) giving test labels
+  """
+  with open(filename, 'rb') as f:
+    header = f.read(PACKED_CIFAR10_HEADER_SIZE)
+  magic_size = len(PACKED_CIFAR10_MAGIC)
+  if header[:magic_size] != PACKED_CIFAR10_MAGIC:
+    raise ValueError('%s is not a packed CIFAR-10 file' % filename)
+  fields = np.frombuffer(header[magic_size:magic_size + 48], dtype='<i8')
+  version, num_train, num_test, H, W, C = [int(v) for v in fields]
+  if version != 1:
+    raise ValueError('Unsupported packed CIFAR-10 version %d' % version)
+
+  N = num_train + num_test
+  offset = PACKED_CIFAR10_HEADER_SIZE
+  X = np.memmap(filename, dtype=np.uint8, mode='r', offset=offset,
+                shape=(N, H, W, C))
+  Y = np.memmap(filename, dtype=np.uint8, mode='r', offset=offset + X.size,
+                shape=(N,))
+  Y = np.array(Y, dtype=np.int64)
+  return X[:num_train], Y[:num_train], X[num_train:], Y[num_train:]
+
+
+def iterate_batches(X, y, batch_size=1000, dtype=np.float64):
+  """
+  Iterate over X and y in order, in minibatches of batch_size. Only the
+  current minibatch of X is converted to dtype, so a packed uint8 dataset is
+  never expanded in full.
+
+  Yields tuples (X_batch, y_batch).
+  """
+  for start in xrange(0, X.shape[0], batch_size):
+    end = start + batch_size
+    yield X[start:end].astype(dtype), y[start:end]
+
+# Images decoded by _decode_images_into are written here. In worker processes
+# this is a view of the shared buffer handed over by _init_image_worker.
+_decode_target = None
+
+
+def _init_image_worker(buf, dtype, shape):
+  global _decode_target
+  _decode_target = np.frombuffer(buf, dtype=dtype).reshape(shape)
+
+
+def _decode_images_into(job):
+  """ Decode a chunk of image files into _decode_target[start:start + len] """
+  start, filenames = job
+  for i, img_file in enumerate(filenames):
+    img = imread(img_file)
+    if img.ndim == 2:
+      ## grayscale file
+      img.shape = img.shape + (1,)
+    _decode_target[start + i] = img.transpose(2, 0, 1)
+  return len(filenames)
+
+
+def load_images(filenames, shape=(3, 64, 64), dtype=np.float32,
+                num_workers=None, chunk_size=256, verbose=True):
+  """
+  Decode a list of image files into a single preallocated array.
+
+  The array lives in shared memory and is split into chunks of consecutive
+  images; a pool of worker processes decodes each chunk straight into its
+  slice of the array, so nothing is copied or concatenated afterwards.
+
+  Inputs:
+  - filenames: List of paths to images; grayscale images are broadcast to
+    all channels.
+  - shape: Tuple (C, H, W) giving the shape of each decoded image.
+  - dtype: numpy datatype of the returned array.
+  - num_workers: Number of worker processes; defaults to the number of CPUs.
+    Use 1 to decode in the current process.
+  - chunk_size: Number of images decoded per task.
+  - verbose: Whether to print progress.
+
+  Returns:
+  - X: Array of shape (len(filenames),) + shape.
+  """
+  global _decode_target
+  if num_workers is None:
+    num_workers = multiprocessing.cpu_count()
+  num_images = len(filenames)
+  shape = (num_images,) + tuple(shape)
+  jobs = [(start, filenames[start:start + chunk_size])
+          for start in xrange(0, num_images, chunk_size)]
+
+  if num_workers == 1:
+    X = np.empty(shape, dtype=dtype)
+    _decode_target = X
+    results = itertools.imap(_decode_images_into, jobs)
+  else:
+    # Forked workers inherit the shared buffer, so only the file names are
+    # sent to them and only chunk sizes come back
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    buf = multiprocessing.RawArray('b', nbytes)
+    X = np.frombuffer(buf, dtype=dtype).reshape(shape)
+    pool = multiprocessing.Pool(num_workers, initializer=_init_image_worker,
+                                initargs=(buf, dtype, shape))
+    results = pool.imap_unordered(_decode_images_into, jobs)
+
+  try:
+    num_done = 0
+    for i, n in enumerate(results):
+      num_done += n
+      if verbose and ((i + 1) % 40 == 0 or num_done == num_images):
+        print 'loaded %d / %d images' % (num_done, num_images)
+  finally:
+    if num_workers == 1:
+      _decode_target = None
+    else:
+      pool.close()
+      pool.join()
+
+  return X
+
+
+def load_tiny_imagenet(path, dtype=np.float32, num_workers=None):
   """
   Load TinyImageNet. Each of TinyImageNet-100-A, TinyImageNet-100-B, and
   TinyImageNet-200 have the same directory structure, so this can be used
@@ -37,6 +221,8 @@ def load_tiny_imagenet(path, dtype=np.float32):
   Inputs:
   - path: String giving path to the directory to load.
   - dtype: numpy datatype used to load the data.
+  - num_workers: Number of processes used to decode the images; defaults to
+    the number of CPUs (see load_images).
 
   Returns: A tuple of
   - class_names: A list where class_names[i] is a list of strings giving the
@@ -63,63 +249,43 @@ def load_tiny_imagenet(path, dtype=np.float32):
       wnid_to_words[wnid] = [w.strip() for w in words.split(',')]
   class_names = [wnid_to_words[wnid] for wnid in wnids]
 
-  # Next load training data.
-  X_train = []
+  # Collect the file names of all training images.
+  train_files = []
   y_train = []
-  for i, wnid in enumerate(wnids):
-    if (i + 1) % 20 == 0:
-      print 'loading training data for synset %d / %d' % (i + 1, len(wnids))
+  for wnid in wnids:
     # To figure out the filenames we need to open the boxes file
     boxes_file = os.path.join(path, 'train', wnid, '%s_boxes.txt' % wnid)
     with open(boxes_file, 'r') as f:
       filenames = [x.split('\t')[0] for x in f]
-    num_images = len(filenames)
-    
-    X_train_block = np.zeros((num_images, 3, 64, 64), dtype=dtype)
-    y_train_block = wnid_to_label[wnid] * np.ones(num_images, dtype=np.int64)
-    for j, img_file in enumerate(filenames):
-      img_file = os.path.join(path, 'train', wnid, 'images', img_file)
-      img = imread(img_file)
-      if img.ndim == 2:
-        ## grayscale file
-        img.shape = (64, 64, 1)
-      X_train_block[j] = img.transpose(2, 0, 1)
-    X_train.append(X_train_block)
-    y_train.append(y_train_block)
-      
-  # We need to concatenate all training data
-  X_train = np.concatenate(X_train, axis=0)
-  y_train = np.concatenate(y_train, axis=0)
+    train_files.extend(os.path.join(path, 'train', wnid, 'images', img_file)
+                       for img_file in filenames)
+    y_train.extend([wnid_to_label[wnid]] * len(filenames))
+  y_train = np.array(y_train, dtype=np.int64)
   
-  # Next load validation data
+  # Next the validation images
   with open(os.path.join(path, 'val', 'val_annotations.txt'), 'r') as f:
-    img_files = []
+    val_files = []
     val_wnids = []
     for line in f:
       img_file, wnid = line.split('\t')[:2]
-      img_files.append(img_file)
+      val_files.append(os.path.join(path, 'val', 'images', img_file))
       val_wnids.append(wnid)
-    num_val = len(img_files)
     y_val = np.array([wnid_to_label[wnid] for wnid in val_wnids])
-    X_val = np.zeros((num_val, 3, 64, 64), dtype=dtype)
-    for i, img_file in enumerate(img_files):
-      img_file = os.path.join(path, 'val', 'images', img_file)
-      img = imread(img_file)
-      if img.ndim == 2:
-        img.shape = (64, 64, 1)
-      X_val[i] = img.transpose(2, 0, 1)
-
-  # Next load test images
+
+  # Next the test images
   # Students won't have test labels, so we need to iterate over files in the
   # images directory.
   img_files = os.listdir(os.path.join(path, 'test', 'images'))
-  X_test = np.zeros((len(img_files), 3, 64, 64), dtype=dtype)
-  for i, img_file in enumerate(img_files):
-    img_file = os.path.join(path, 'test', 'images', img_file)
-    img = imread(img_file)
-    if img.ndim == 2:
-      img.shape = (64, 64, 1)
-    X_test[i] = img.transpose(2, 0, 1)
+  test_files = [os.path.join(path, 'test', 'images', img_file)
+                for img_file in img_files]
+
+  # Decode everything into one array and split it into views
+  X = load_images(train_files + val_files + test_files, dtype=dtype,
+                  num_workers=num_workers)
+  num_train, num_val = len(train_files), len(val_files)
+  X_train = X[:num_train]
+  X_val = X[num_train:num_train + num_val]
+  X_test = X[num_train + num_val:]
 
   y_test = None
   y_test_file = os.path.join(path, 'test', 'test_annotations.txt')
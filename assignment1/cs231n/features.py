@@ -1,6 +1,5 @@
 import matplotlib
 import numpy as np
-from scipy.ndimage import uniform_filter
 
 
 def extract_features(imgs, feature_fns, verbose=False):
@@ -66,7 +65,8 @@ def rgb2gray(rgb):
   return np.dot(rgb[...,:3], [0.299, 0.587, 0.144])
 
 
-def hog_feature(im):
+def hog_feature(im, pixels_per_cell=(8, 8), orientations=9,
+                cells_per_block=None):
   """Compute Histogram of Gradient (HOG) feature for an image
   
        Modified from skimage.feature.hog
@@ -78,21 +78,44 @@ def hog_feature(im):
      
     Parameters:
       im : an input grayscale or rgb image
+      pixels_per_cell : (cx, cy) size of a cell in pixels (default: (8, 8))
+      orientations : number of gradient bins (default: 9)
+      cells_per_block : (bx, by) size of a normalization block in cells, or
+        None to return the unnormalized cell histograms (default: None)
       
     Returns:
       feat: Histogram of Gradient (HOG) feature
     
   """
-  
+  tables = hog_integral_images(im, orientations=orientations)
+  return hog_from_integral_images(tables, pixels_per_cell=pixels_per_cell,
+                                  cells_per_block=cells_per_block)
+
+
+def hog_integral_images(im, orientations=9):
+  """Compute one summed-area table of gradient magnitude per orientation bin
+
+    Each pixel is binned once, so the cost does not depend on the cell size
+    and the same tables can be pooled with many different HOG configurations
+    by hog_from_integral_images.
+
+    Parameters:
+      im : an input grayscale or rgb image
+      orientations : number of gradient bins (default: 9)
+
+    Returns:
+      tables : array of shape (sx + 1, sy + 1, orientations) where
+        tables[x, y, i] is the total gradient magnitude of bin i over
+        image[:x, :y]
+
+  """
   # convert rgb to grayscale if needed
   if im.ndim == 3:
     image = rgb2gray(im)
   else:
-    image = np.at_least_2d(im)
+    image = np.atleast_2d(im)
 
   sx, sy = image.shape # image size
-  orientations = 9 # number of gradient bins
-  cx, cy = (8, 8) # pixels per cell
 
   gx = np.zeros(image.shape)
   gy = np.zeros(image.shape)
@@ -101,23 +124,64 @@ def hog_feature(im):
   grad_mag = np.sqrt(gx ** 2 + gy ** 2) # gradient magnitude
   grad_ori = np.arctan2(gy, (gx + 1e-15)) * (180 / np.pi) + 90 # gradient orientation
 
-  n_cellsx = int(np.floor(sx / cx))  # number of cells in x
-  n_cellsy = int(np.floor(sy / cy))  # number of cells in y
-  # compute orientations integral images
-  orientation_histogram = np.zeros((n_cellsx, n_cellsy, orientations))
-  for i in range(orientations):
-    # create new integral image for this orientation
-    # isolate orientations in this range
-    temp_ori = np.where(grad_ori < 180 / orientations * (i + 1),
-                        grad_ori, 0)
-    temp_ori = np.where(grad_ori >= 180 / orientations * i,
-                        temp_ori, 0)
-    # select magnitudes for those orientations
-    cond2 = temp_ori > 0
-    temp_mag = np.where(cond2, grad_mag, 0)
-    orientation_histogram[:,:,i] = uniform_filter(temp_mag, size=(cx, cy))[cx/2::cx, cy/2::cy].T
-  
-  return orientation_histogram.ravel()
+  # Orientations outside of (0, 180) fall in no bin, as in skimage
+  bins = np.floor(grad_ori / (180.0 / orientations)).astype(np.intp)
+  rows, cols = np.nonzero((grad_ori > 0) & (bins < orientations))
+
+  tables = np.zeros((sx + 1, sy + 1, orientations))
+  tables[rows + 1, cols + 1, bins[rows, cols]] = grad_mag[rows, cols]
+  tables = tables.cumsum(axis=0).cumsum(axis=1)
+  return tables
+
+
+def hog_from_integral_images(tables, pixels_per_cell=(8, 8),
+                             cells_per_block=None, eps=1e-5):
+  """Pool orientation integral images into a HOG feature
+
+    Every cell (and every block energy) is read off a summed-area table with
+    four lookups, so arbitrary cell and block sizes cost the same.
+
+    Parameters:
+      tables : integral images as returned by hog_integral_images
+      pixels_per_cell : (cx, cy) size of a cell in pixels (default: (8, 8))
+      cells_per_block : (bx, by) size of a normalization block in cells, or
+        None to return the unnormalized cell histograms (default: None)
+      eps : constant for numeric stability of the block normalization
+
+    Returns:
+      feat: Histogram of Gradient (HOG) feature
+
+  """
+  cx, cy = pixels_per_cell
+  n_cellsx = (tables.shape[0] - 1) / cx  # number of cells in x
+  n_cellsy = (tables.shape[1] - 1) / cy  # number of cells in y
+
+  # average magnitude of each cell, read off the corners of the cell grid
+  corners = tables[:n_cellsx * cx + 1:cx, :n_cellsy * cy + 1:cy]
+  hist = (corners[1:, 1:] - corners[:-1, 1:]
+          - corners[1:, :-1] + corners[:-1, :-1]) / (cx * cy)
+
+  # lay the cells out with x varying fastest
+  orientation_histogram = np.ascontiguousarray(hist.transpose(1, 0, 2))
+  if cells_per_block is None:
+    return orientation_histogram.ravel()
+
+  # L2-normalize every block of bx x by cells; the squared norm of each block
+  # comes from a second integral image over the cell energies
+  bx, by = cells_per_block
+  n_cells0, n_cells1, orientations = orientation_histogram.shape
+  energy = np.zeros((n_cells0 + 1, n_cells1 + 1))
+  energy[1:, 1:] = np.sum(orientation_histogram ** 2, axis=2)
+  energy = energy.cumsum(axis=0).cumsum(axis=1)
+  block_energy = (energy[bx:, by:] - energy[:-bx, by:]
+                  - energy[bx:, :-by] + energy[:-bx, :-by])
+
+  s0, s1, s2 = orientation_histogram.strides
+  blocks = np.lib.stride_tricks.as_strided(orientation_histogram,
+             shape=(n_cells0 - bx + 1, n_cells1 - by + 1, bx, by, orientations),
+             strides=(s0, s1, s0, s1, s2))
+  norms = np.sqrt(block_energy + eps ** 2)
+  return (blocks / norms[:, :, None, None, None]).ravel()
 
 
 def color_histogram_hsv(im, nbin=10, xmin=0, xmax=255, normalized=True):
@@ -0,0 +1,126 @@
+import numpy as np
+
+
+class Augmenter(object):
+  """
+  An Augmenter applies random crops, horizontal flips and color jitter to
+  whole minibatches of images of shape (N, C, H, W).
+
+  Every operation is vectorized over the minibatch: crops and flips are read
+  from a strided window view of a zero-padded copy of the minibatch, and
+  jitter is applied with broadcasting. The padded copy is a buffer that is
+  allocated once and reused for every minibatch of the same shape.
+
+  An Augmenter can be passed to Solver through the augment option, or used
+  directly as the transform of a data_loader.MinibatchLoader so that
+  augmentation runs in the background thread:
+
+  augment = Augmenter(crop_pad=4, flip=True, brightness=10.0)
+  solver = Solver(model, data, augment=augment, num_prefetch=2, ...)
+
+  Images must have a floating point dtype.
+  """
+
+  def __init__(self, crop_pad=0, flip=True, brightness=0.0, contrast=0.0,
+               color=0.0, seed=None):
+    """
+    Construct a new Augmenter.
+
+    Inputs:
+    - crop_pad: Each image is zero-padded by crop_pad pixels on every side
+      and an (H, W) crop is taken at a random offset, so the output has the
+      same shape as the input. 0 disables cropping.
+    - flip: If True, each image is mirrored horizontally with probability 0.5.
+    - brightness: Each image is shifted by a value drawn uniformly from
+      [-brightness, brightness].
+    - contrast: Each image is scaled around its mean by a factor drawn
+      uniformly from [1 - contrast, 1 + contrast].
+    - color: Each channel of each image is shifted by a value drawn uniformly
+      from [-color, color].
+    - seed: Optional seed for the random number generator of this Augmenter.
+    """
+    self.crop_pad = crop_pad
+    self.flip = flip
+    self.brightness = brightness
+    self.contrast = contrast
+    self.color = color
+    self.rng = np.random.RandomState(seed)
+    self._padded = None
+
+
+  def __call__(self, X, out=None):
+    """
+    Augment a minibatch.
+
+    Inputs:
+    - X: Array of shape (N, C, H, W) giving a minibatch of images.
+    - out: Array of the same shape and dtype as X to write the result to.
+      By default X is augmented in place.
+
+    Returns:
+    - out: The augmented minibatch.
+    """
+    if out is None:
+      out = X
+    N, C, H, W = X.shape
+
+    flip = np.zeros(N, dtype=bool)
+    if self.flip:
+      flip = self.rng.rand(N) < 0.5
+
+    if self.crop_pad > 0:
+      self._crop_and_flip(X, out, flip)
+    else:
+      if out is not X:
+        out[...] = X
+      idx = np.nonzero(flip)[0]
+      out[idx] = out[idx, :, :, ::-1]
+
+    self._jitter(out)
+    return out
+
+
+  def _crop_and_flip(self, X, out, flip):
+    N, C, H, W = X.shape
+    p = self.crop_pad
+    padded_shape = (N, C, H + 2 * p, W + 2 * p)
+    if (self._padded is None or self._padded.shape != padded_shape
+        or self._padded.dtype != X.dtype):
+      self._padded = np.zeros(padded_shape, dtype=X.dtype)
+    padded = self._padded
+    # Only the interior is ever written, so the border stays zero
+    padded[:, :, p:p + H, p:p + W] = X
+
+    # windows[n, dy, dx] is the (C, H, W) crop of image n at offset (dy, dx);
+    # the mirrored view does the same for the horizontally flipped images.
+    windows = []
+    for view in (padded, padded[:, :, :, ::-1]):
+      sN, sC, sH, sW = view.strides
+      windows.append(np.lib.stride_tricks.as_strided(view,
+                       shape=(N, 2 * p + 1, 2 * p + 1, C, H, W),
+                       strides=(sN, sH, sW, sC, sH, sW)))
+
+    dy = self.rng.randint(2 * p + 1, size=N)
+    dx = self.rng.randint(2 * p + 1, size=N)
+    for window, mask in zip(windows, (~flip, flip)):
+      idx = np.nonzero(mask)[0]
+      out[idx] = window[idx, dy[idx], dx[idx]]
+
+
+  def _jitter(self, out):
+    N, C = out.shape[:2]
+    if self.contrast > 0:
+      scale = self.rng.uniform(1 - self.contrast, 1 + self.contrast, size=N)
+      scale = scale.astype(out.dtype).reshape(N, 1, 1, 1)
+      mean = out.mean(axis=(1, 2, 3), keepdims=True)
+      out -= mean
+      out *= scale
+      out += mean
+    if self.brightness > 0 or self.color > 0:
+      shift = np.zeros((N, C), dtype=out.dtype)
+      if self.brightness > 0:
+        shift += self.rng.uniform(-self.brightness, self.brightness,
+                                  size=(N, 1))
+      if self.color > 0:
+        shift += self.rng.uniform(-self.color, self.color, size=(N, C))
+      out += shift.reshape(N, C, 1, 1)
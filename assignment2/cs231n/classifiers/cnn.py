@@ -30,12 +30,14 @@ class ThreeLayerConvNet(object):
   
   The network operates on minibatches of data that have shape (N, C, H, W)
   consisting of N images, each with height H and width W and with C input
-  channels.
+  channels. With layout='NHWC' it takes channels-last minibatches of shape
+  (N, H, W, C) instead and runs every layer in that layout, so no activation
+  is ever transposed.
   """
   
   def __init__(self, input_dim=(3, 32, 32), num_filters=32, filter_size=7,
                hidden_dim=100, num_classes=10, weight_scale=1e-3, reg=0.0,
-               dtype=np.float32):
+               dtype=np.float32, layout='NCHW'):
     """
     Initialize a new network.
     
@@ -49,10 +51,15 @@ class ThreeLayerConvNet(object):
       of weights.
     - reg: Scalar giving L2 regularization strength
     - dtype: numpy datatype to use for computation.
+    - layout: 'NCHW' or 'NHWC', the layout of the input data and of the
+      activations of the convolutional layer. The pooled activations are
+      flattened in (C, H, W) order in both layouts, so the same parameters
+      give the same scores either way.
     """
     self.params = {}
     self.reg = reg
     self.dtype = dtype
+    self.layout = layout
     
     ############################################################################
     # TODO: Initialize weights and biases for the three-layer convolutional    #
@@ -103,10 +110,12 @@ class ThreeLayerConvNet(object):
     
     # pass conv_param to the forward pass for the convolutional layer
     filter_size = W1.shape[2]
-    conv_param = {'stride': 1, 'pad': (filter_size - 1) / 2}
+    conv_param = {'stride': 1, 'pad': (filter_size - 1) / 2,
+                  'layout': self.layout}
 
     # pass pool_param to the forward pass for the max-pooling layer
-    pool_param = {'pool_height': 2, 'pool_width': 2, 'stride': 2}
+    pool_param = {'pool_height': 2, 'pool_width': 2, 'stride': 2,
+                  'layout': self.layout}
 
     scores = None
     ############################################################################
@@ -115,6 +124,9 @@ class ThreeLayerConvNet(object):
     # variable.                                                                #
     ############################################################################
     out_conv, cache_conv = conv_relu_pool_forward(X, W1, b1, conv_param, pool_param)
+    if self.layout == 'NHWC':
+      # Flatten in (C, H, W) order so that the rows of W2 match NCHW
+      out_conv = out_conv.transpose(0, 3, 1, 2)
     conv_shape = out_conv.shape
     out_hidden, cache_hidden = affine_relu_forward(out_conv.reshape(conv_shape[0], -1), W2, b2)
     scores, cache_scores = affine_forward(out_hidden, W3, b3)
@@ -145,7 +157,10 @@ class ThreeLayerConvNet(object):
     grads['b2'] = db
     
     # for W1, b1
-    _, dW, db = conv_relu_pool_backward(dout.reshape(conv_shape), cache_conv)
+    dout = dout.reshape(conv_shape)
+    if self.layout == 'NHWC':
+      dout = dout.transpose(0, 2, 3, 1)
+    _, dW, db = conv_relu_pool_backward(dout, cache_conv)
     grads['W1'] = dW + self.reg * W1
     grads['b1'] = db
     ############################################################################
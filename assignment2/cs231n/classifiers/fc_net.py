@@ -19,7 +19,7 @@ def affine_bn_relu_forward(x, w, b, gamma, beta, bn_param):
   # (out, cache) of the affine_forward: a = w*x+b
   a, fc_cache = affine_forward(x, w, b)
   # (out, cache) of the batch_normalization: y = gamma*x_hat+beta 
-  y, bn_cache = batchnorm_forward(a, gamma, beta, bn_param)
+  y, bn_cache = batchnorm_forward_fused(a, gamma, beta, bn_param)
   # (out, cache) of the Relu: out = max(0, y)
   out, relu_cache = relu_forward(y)
   cache = (fc_cache, bn_cache, relu_cache)
@@ -32,8 +32,8 @@ def affine_bn_relu_backward(dout, cache):
   fc_cache, bn_cache, relu_cache = cache
   # Relu(a) = out
   da = relu_backward(dout, relu_cache)
-  # BN(x, gamma, beta) = y
-  dy, dgamma, dbeta = batchnorm_backward(da, bn_cache)
+  # BN(x, gamma, beta) = y; da is a new array, so it can be overwritten
+  dy, dgamma, dbeta = batchnorm_backward_fused(da, bn_cache, in_place=True)
   # f(x, w, b) = y
   dx, dw, db = affine_backward(dy, fc_cache)
   return dx, dw, db, dgamma, dbeta
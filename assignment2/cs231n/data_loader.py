@@ -0,0 +1,137 @@
+import Queue
+import sys
+import threading
+
+import numpy as np
+
+
+class MinibatchLoader(object):
+  """
+  A MinibatchLoader samples random minibatches of training data in a
+  background thread so that gathering the next minibatches overlaps with the
+  forward and backward pass on the current one.
+
+  Minibatches are gathered into a fixed ring of preallocated buffers that are
+  reused for the whole run, so no memory is allocated per step. The arrays
+  returned by next_batch() are views of one of these buffers; they stay valid
+  until the following call to next_batch(), at which point the buffer is
+  handed back to the background thread and overwritten.
+
+  Example usage:
+
+  loader = MinibatchLoader(X_train, y_train, batch_size=100, num_prefetch=2)
+  for t in xrange(num_iterations):
+    X_batch, y_batch = loader.next_batch()
+    ...
+  loader.close()
+  """
+
+  def __init__(self, X, y, batch_size, num_prefetch=2, transform=None,
+               seed=None):
+    """
+    Construct a new MinibatchLoader and start its background thread.
+
+    Inputs:
+    - X: Array of shape (N, d_1, ..., d_k) giving the data to sample from.
+      This can also be a read-only memory-mapped array.
+    - y: Array of shape (N,) giving labels for X.
+    - batch_size: Number of examples per minibatch.
+    - num_prefetch: Number of minibatches to prepare ahead of the one being
+      used; the ring holds num_prefetch + 1 buffers.
+    - transform: Optional function called in the background thread as
+      transform(X_batch) after each gather. It must return an array of the
+      same shape and dtype as its input, and may modify it in place.
+    - seed: Optional seed for the sampling. By default the seed is drawn from
+      np.random, so seeding np.random still makes runs reproducible.
+    """
+    if num_prefetch < 1:
+      raise ValueError('num_prefetch must be at least 1')
+    self.X = X
+    self.y = y
+    self.batch_size = batch_size
+    self.transform = transform
+    if seed is None:
+      seed = np.random.randint(2 ** 31)
+    self._rng = np.random.RandomState(seed)
+
+    num_buffers = num_prefetch + 1
+    self._X_buffers = [np.empty((batch_size,) + X.shape[1:], dtype=X.dtype)
+                       for _ in xrange(num_buffers)]
+    self._y_buffers = [np.empty(batch_size, dtype=y.dtype)
+                       for _ in xrange(num_buffers)]
+
+    self._free = Queue.Queue()
+    self._ready = Queue.Queue()
+    for i in xrange(num_buffers):
+      self._free.put(i)
+    self._in_use = None
+    self._error = None
+
+    self._stop = threading.Event()
+    self._thread = threading.Thread(target=self._worker)
+    self._thread.daemon = True
+    self._thread.start()
+
+
+  def next_batch(self):
+    """
+    Return the next minibatch as a tuple (X_batch, y_batch), blocking until
+    it is ready. The minibatch returned by the previous call is released.
+
+    If the background thread failed, its exception is raised here with the
+    original traceback, and again on every later call.
+    """
+    if self._error is not None:
+      exc_type, exc_value, tb = self._error
+      raise exc_type, exc_value, tb
+    if self._stop.is_set():
+      raise RuntimeError('MinibatchLoader has been closed')
+    if self._in_use is not None:
+      self._free.put(self._in_use)
+      self._in_use = None
+
+    item = self._ready.get()
+    if isinstance(item, tuple):
+      # The background thread failed and has exited, so no more minibatches
+      # will arrive; keep its exception to raise on every call
+      self._error = item
+      self._stop.set()
+      exc_type, exc_value, tb = item
+      raise exc_type, exc_value, tb
+    self._in_use = item
+    return self._X_buffers[item], self._y_buffers[item]
+
+
+  def close(self):
+    """
+    Stop the background thread. The loader cannot be used afterwards.
+    """
+    self._stop.set()
+    self._free.put(None)
+    self._thread.join()
+
+
+  def _worker(self):
+    num_train = self.X.shape[0]
+    while True:
+      i = self._free.get()
+      if i is None or self._stop.is_set():
+        return
+      try:
+        # Gather rows in increasing order, which keeps reads from a
+        # memory-mapped X sequential
+        batch_mask = np.sort(self._rng.choice(num_train, self.batch_size))
+        X_batch, y_batch = self._X_buffers[i], self._y_buffers[i]
+        # The indices are always in range. With the default mode='raise',
+        # take would gather into a temporary and copy it into out; 'clip'
+        # writes straight into the buffers
+        np.take(self.X, batch_mask, axis=0, out=X_batch, mode='clip')
+        np.take(self.y, batch_mask, axis=0, out=y_batch, mode='clip')
+        if self.transform is not None:
+          X_out = self.transform(X_batch)
+          if X_out is not X_batch:
+            X_batch[...] = X_out
+      except Exception:
+        self._ready.put(sys.exc_info())
+        return
+      self._ready.put(i)
@@ -1,20 +1,42 @@
 import cPickle as pickle
 import numpy as np
+import itertools
+import multiprocessing
 import os
+from collections import OrderedDict
 from scipy.misc import imread
 
-def load_CIFAR_batch(filename):
-  """ load single batch of cifar """
+PACKED_CIFAR10_FILE = 'cifar10_uint8.bin'
+PACKED_CIFAR10_MAGIC = 'CIFAR10\0'
+PACKED_CIFAR10_HEADER_SIZE = 64
+
+
+def load_CIFAR_batch(filename, dtype="float"):
+  """ load single batch of cifar; pass dtype=None to keep the raw uint8 pixels """
   with open(filename, 'rb') as f:
     datadict = pickle.load(f)
     X = datadict['data']
     Y = datadict['labels']
-    X = X.reshape(10000, 3, 32, 32).transpose(0,2,3,1).astype("float")
+    X = X.reshape(10000, 3, 32, 32).transpose(0,2,3,1)
+    if dtype is not None:
+      X = X.astype(dtype)
     Y = np.array(Y)
     return X, Y
 
-def load_CIFAR10(ROOT):
-  """ load all of cifar """
+def load_CIFAR10(ROOT, packed=False):
+  """
+  load all of cifar
+
+  If packed is True, the batches are converted once into a single uint8 file
+  inside ROOT (see pack_CIFAR10) and every later call memory-maps that file
+  instead of unpickling; the returned images are then read-only uint8 arrays.
+  """
+  if packed:
+    filename = os.path.join(ROOT, PACKED_CIFAR10_FILE)
+    if not os.path.isfile(filename):
+      pack_CIFAR10(ROOT, filename)
+    return load_CIFAR10_packed(filename)
+
   xs = []
   ys = []
   for b in range(1,6):
@@ -29,37 +51,152 @@ def load_CIFAR10(ROOT):
   return Xtr, Ytr, Xte, Yte
 
 
-def get_CIFAR10_data(num_training=49000, num_validation=1000, num_test=1000):
+def pack_CIFAR10(ROOT, filename):
+  """
+  Convert the pickled CIFAR-10 batches in ROOT into a single binary file that
+  load_CIFAR10_packed can memory-map.
+
+  The file starts with a 64 byte header holding a magic string followed by
+  little-endian int64 values (version, num_train, num_test, H, W, C). It is
+  followed by all images as uint8 in (N, H, W, C) order, training images
+  first, and then by all labels as uint8.
+
+  Inputs:
+  - ROOT: Directory containing the cifar-10-batches-py files.
+  - filename: Path of the packed file to write.
+  """
+  batch_files = [os.path.join(ROOT, 'data_batch_%d' % (b, )) for b in range(1, 6)]
+  batch_files.append(os.path.join(ROOT, 'test_batch'))
+
+  # Write to a temporary file first so that a crash never leaves behind a
+  # truncated file that looks valid
+  tmp_filename = filename + '.tmp'
+  ys = []
+  with open(tmp_filename, 'wb') as f:
+    f.write('\0' * PACKED_CIFAR10_HEADER_SIZE)
+    for batch_file in batch_files:
+      X, Y = load_CIFAR_batch(batch_file, dtype=None)
+      f.write(np.ascontiguousarray(X).tostring())
+      ys.append(Y)
+    f.write(np.concatenate(ys).astype(np.uint8).tostring())
+
+    num_train = sum(Y.shape[0] for Y in ys[:-1])
+    num_test = ys[-1].shape[0]
+    header = np.array((1, num_train, num_test) + X.shape[1:], dtype='<i8')
+    f.seek(0)
+    f.write(PACKED_CIFAR10_MAGIC + header.tostring())
+  os.rename(tmp_filename, filename)
+
+
+def load_CIFAR10_packed(filename):
+  """
+  Memory-map a file written by pack_CIFAR10. Nothing is read from disk until
+  the returned images are accessed.
+
+  Returns a tuple of:
+  - Xtr: Read-only uint8 array of shape (num_train, H, W, C)
+  - Ytr: Array of shape (num_train,) giving training labels
+  - Xte: Read-only uint8 array of shape (num_test, H, W, C)
+  - Yte: Array of shape (num_test,) giving test labels
+  """
+  with open(filename, 'rb') as f:
+    header = f.read(PACKED_CIFAR10_HEADER_SIZE)
+  magic_size = len(PACKED_CIFAR10_MAGIC)
+  if header[:magic_size] != PACKED_CIFAR10_MAGIC:
+    raise ValueError('%s is not a packed CIFAR-10 file' % filename)
+  fields = np.frombuffer(header[magic_size:magic_size + 48], dtype='<i8')
+  version, num_train, num_test, H, W, C = [int(v) for v in fields]
+  if version != 1:
+    raise ValueError('Unsupported packed CIFAR-10 version %d' % version)
+
+  N = num_train + num_test
+  offset = PACKED_CIFAR10_HEADER_SIZE
+  X = np.memmap(filename, dtype=np.uint8, mode='r', offset=offset,
+                shape=(N, H, W, C))
+  Y = np.memmap(filename, dtype=np.uint8, mode='r', offset=offset + X.size,
+                shape=(N,))
+  Y = np.array(Y, dtype=np.int64)
+  return X[:num_train], Y[:num_train], X[num_train:], Y[num_train:]
+
+
+def iterate_batches(X, y, batch_size=1000, dtype=np.float64):
+  """
+  Iterate over X and y in order, in minibatches of batch_size. Only the
+  current minibatch of X is converted to dtype, so a packed uint8 dataset is
+  never expanded in full.
+
+  Yields tuples (X_batch, y_batch).
+  """
+  for start in xrange(0, X.shape[0], batch_size):
+    end = start + batch_size
+    yield X[start:end].astype(dtype), y[start:end]
+
+
+def _channels_first(X, mean_image=None, dtype=np.float64):
+  """
+  Convert images of shape (N, H, W, C) to a new array of shape (N, C, H, W)
+  and the given dtype, optionally subtracting mean_image of shape (H, W, C).
+  The subtraction, transpose and dtype conversion happen in a single pass
+  that writes straight into the preallocated output.
+  """
+  N, H, W, C = X.shape
+  out = np.empty((N, C, H, W), dtype=dtype)
+  X_t = X.transpose(0, 3, 1, 2)
+  if mean_image is None:
+    np.copyto(out, X_t, casting='unsafe')
+  else:
+    np.subtract(X_t, mean_image.transpose(2, 0, 1), out=out, casting='unsafe')
+  return out
+
+
+def _channels_last(X, mean_image=None, dtype=np.float64):
+  """
+  Like _channels_first, but keep the (N, H, W, C) layout of the images for
+  models that run with channels-last layers.
+  """
+  out = np.empty(X.shape, dtype=dtype)
+  if mean_image is None:
+    np.copyto(out, X, casting='unsafe')
+  else:
+    np.subtract(X, mean_image, out=out, casting='unsafe')
+  return out
+
+
+def get_CIFAR10_data(num_training=49000, num_validation=1000, num_test=1000,
+                     dtype=np.float64, channels_last=False, packed=False):
     """
     Load the CIFAR-10 dataset from disk and perform preprocessing to prepare
     it for classifiers. These are the same steps as we used for the SVM, but
     condensed to a single function.
+
+    Each split is written once, already normalized and transposed, into a
+    new array of the requested dtype; pass dtype=np.float32 to halve the
+    memory. With channels_last=True the images keep the (N, H, W, C) layout
+    of the raw data, for models that use the NHWC layout in fast_layers.
+    With packed=True the raw images are memory-mapped as uint8 from a packed
+    copy of the batches (see load_CIFAR10), which is written to the dataset
+    directory on the first call.
     """
     # Load the raw CIFAR-10 data
     cifar10_dir = 'cs231n/datasets/cifar-10-batches-py'
-    X_train, y_train, X_test, y_test = load_CIFAR10(cifar10_dir)
+    X_train, y_train, X_test, y_test = load_CIFAR10(cifar10_dir, packed=packed)
         
-    # Subsample the data
-    mask = range(num_training, num_training + num_validation)
-    X_val = X_train[mask]
-    y_val = y_train[mask]
-    mask = range(num_training)
-    X_train = X_train[mask]
-    y_train = y_train[mask]
-    mask = range(num_test)
-    X_test = X_test[mask]
-    y_test = y_test[mask]
+    # Subsample the data; slicing gives views, not copies
+    X_val = X_train[num_training:num_training + num_validation]
+    y_val = y_train[num_training:num_training + num_validation]
+    X_train = X_train[:num_training]
+    y_train = y_train[:num_training]
+    X_test = X_test[:num_test]
+    y_test = y_test[:num_test]
 
     # Normalize the data: subtract the mean image
-    mean_image = np.mean(X_train, axis=0)
-    X_train -= mean_image
-    X_val -= mean_image
-    X_test -= mean_image
+    mean_image = np.mean(X_train, axis=0, dtype=np.float64)
     
-    # Transpose so that channels come first
-    X_train = X_train.transpose(0, 3, 1, 2).copy()
-    X_val = X_val.transpose(0, 3, 1, 2).copy()
-    X_test = X_test.transpose(0, 3, 1, 2).copy()
+    # Transpose so that channels come first, unless they should stay last
+    convert = _channels_last if channels_last else _channels_first
+    X_train = convert(X_train, mean_image, dtype)
+    X_val = convert(X_val, mean_image, dtype)
+    X_test = convert(X_test, mean_image, dtype)
 
     # Package data into a dictionary
     return {
@@ -69,7 +206,89 @@ def get_CIFAR10_data(num_training=49000, num_validation=1000, num_test=1000):
     }
     
 
-def load_tiny_imagenet(path, dtype=np.float32):
+# Images decoded by _decode_images_into are written here. In worker processes
+# this is a view of the shared buffer handed over by _init_image_worker.
+_decode_target = None
+
+
+def _init_image_worker(buf, dtype, shape):
+  global _decode_target
+  _decode_target = np.frombuffer(buf, dtype=dtype).reshape(shape)
+
+
+def _decode_images_into(job):
+  """ Decode a chunk of image files into _decode_target[start:start + len] """
+  start, filenames = job
+  for i, img_file in enumerate(filenames):
+    img = imread(img_file)
+    if img.ndim == 2:
+      ## grayscale file
+      img.shape = img.shape + (1,)
+    _decode_target[start + i] = img.transpose(2, 0, 1)
+  return len(filenames)
+
+
+def load_images(filenames, shape=(3, 64, 64), dtype=np.float32,
+                num_workers=None, chunk_size=256, verbose=True):
+  """
+  Decode a list of image files into a single preallocated array.
+
+  The array lives in shared memory and is split into chunks of consecutive
+  images; a pool of worker processes decodes each chunk straight into its
+  slice of the array, so nothing is copied or concatenated afterwards.
+
+  Inputs:
+  - filenames: List of paths to images; grayscale images are broadcast to
+    all channels.
+  - shape: Tuple (C, H, W) giving the shape of each decoded image.
+  - dtype: numpy datatype of the returned array.
+  - num_workers: Number of worker processes; defaults to the number of CPUs.
+    Use 1 to decode in the current process.
+  - chunk_size: Number of images decoded per task.
+  - verbose: Whether to print progress.
+
+  Returns:
+  - X: Array of shape (len(filenames),) + shape.
+  """
+  global _decode_target
+  if num_workers is None:
+    num_workers = multiprocessing.cpu_count()
+  num_images = len(filenames)
+  shape = (num_images,) + tuple(shape)
+  jobs = [(start, filenames[start:start + chunk_size])
+          for start in xrange(0, num_images, chunk_size)]
+
+  if num_workers == 1:
+    X = np.empty(shape, dtype=dtype)
+    _decode_target = X
+    results = itertools.imap(_decode_images_into, jobs)
+  else:
+    # Forked workers inherit the shared buffer, so only the file names are
+    # sent to them and only chunk sizes come back
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    buf = multiprocessing.RawArray('b', nbytes)
+    X = np.frombuffer(buf, dtype=dtype).reshape(shape)
+    pool = multiprocessing.Pool(num_workers, initializer=_init_image_worker,
+                                initargs=(buf, dtype, shape))
+    results = pool.imap_unordered(_decode_images_into, jobs)
+
+  try:
+    num_done = 0
+    for i, n in enumerate(results):
+      num_done += n
+      if verbose and ((i + 1) % 40 == 0 or num_done == num_images):
+        print 'loaded %d / %d images' % (num_done, num_images)
+  finally:
+    if num_workers == 1:
+      _decode_target = None
+    else:
+      pool.close()
+      pool.join()
+
+  return X
+
+
+def load_tiny_imagenet(path, dtype=np.float32, num_workers=None):
   """
   Load TinyImageNet. Each of TinyImageNet-100-A, TinyImageNet-100-B, and
   TinyImageNet-200 have the same directory structure, so this can be used
@@ -78,6 +297,8 @@ def load_tiny_imagenet(path, dtype=np.float32):
   Inputs:
   - path: String giving path to the directory to load.
   - dtype: numpy datatype used to load the data.
+  - num_workers: Number of processes used to decode the images; defaults to
+    the number of CPUs (see load_images).
 
   Returns: A tuple of
   - class_names: A list where class_names[i] is a list of strings giving the
@@ -104,63 +325,43 @@ def load_tiny_imagenet(path, dtype=np.float32):
       wnid_to_words[wnid] = [w.strip() for w in words.split(',')]
   class_names = [wnid_to_words[wnid] for wnid in wnids]
 
-  # Next load training data.
-  X_train = []
+  # Collect the file names of all training images.
+  train_files = []
   y_train = []
-  for i, wnid in enumerate(wnids):
-    if (i + 1) % 20 == 0:
-      print 'loading training data for synset %d / %d' % (i + 1, len(wnids))
+  for wnid in wnids:
     # To figure out the filenames we need to open the boxes file
     boxes_file = os.path.join(path, 'train', wnid, '%s_boxes.txt' % wnid)
     with open(boxes_file, 'r') as f:
       filenames = [x.split('\t')[0] for x in f]
-    num_images = len(filenames)
-    
-    X_train_block = np.zeros((num_images, 3, 64, 64), dtype=dtype)
-    y_train_block = wnid_to_label[wnid] * np.ones(num_images, dtype=np.int64)
-    for j, img_file in enumerate(filenames):
-      img_file = os.path.join(path, 'train', wnid, 'images', img_file)
-      img = imread(img_file)
-      if img.ndim == 2:
-        ## grayscale file
-        img.shape = (64, 64, 1)
-      X_train_block[j] = img.transpose(2, 0, 1)
-    X_train.append(X_train_block)
-    y_train.append(y_train_block)
-      
-  # We need to concatenate all training data
-  X_train = np.concatenate(X_train, axis=0)
-  y_train = np.concatenate(y_train, axis=0)
+    train_files.extend(os.path.join(path, 'train', wnid, 'images', img_file)
+                       for img_file in filenames)
+    y_train.extend([wnid_to_label[wnid]] * len(filenames))
+  y_train = np.array(y_train, dtype=np.int64)
   
-  # Next load validation data
+  # Next the validation images
   with open(os.path.join(path, 'val', 'val_annotations.txt'), 'r') as f:
-    img_files = []
+    val_files = []
     val_wnids = []
     for line in f:
       img_file, wnid = line.split('\t')[:2]
-      img_files.append(img_file)
+      val_files.append(os.path.join(path, 'val', 'images', img_file))
       val_wnids.append(wnid)
-    num_val = len(img_files)
     y_val = np.array([wnid_to_label[wnid] for wnid in val_wnids])
-    X_val = np.zeros((num_val, 3, 64, 64), dtype=dtype)
-    for i, img_file in enumerate(img_files):
-      img_file = os.path.join(path, 'val', 'images', img_file)
-      img = imread(img_file)
-      if img.ndim == 2:
-        img.shape = (64, 64, 1)
-      X_val[i] = img.transpose(2, 0, 1)
-
-  # Next load test images
+
+  # Next the test images
   # Students won't have test labels, so we need to iterate over files in the
   # images directory.
   img_files = os.listdir(os.path.join(path, 'test', 'images'))
-  X_test = np.zeros((len(img_files), 3, 64, 64), dtype=dtype)
-  for i, img_file in enumerate(img_files):
-    img_file = os.path.join(path, 'test', 'images', img_file)
-    img = imread(img_file)
-    if img.ndim == 2:
-      img.shape = (64, 64, 1)
-    X_test[i] = img.transpose(2, 0, 1)
+  test_files = [os.path.join(path, 'test', 'images', img_file)
+                for img_file in img_files]
+
+  # Decode everything into one array and split it into views
+  X = load_images(train_files + val_files + test_files, dtype=dtype,
+                  num_workers=num_workers)
+  num_train, num_val = len(train_files), len(val_files)
+  X_train = X[:num_train]
+  X_val = X[num_train:num_train + num_val]
+  X_test = X[num_train + num_val:]
 
   y_test = None
   y_test_file = os.path.join(path, 'test', 'test_annotations.txt')
@@ -176,12 +377,291 @@ def load_tiny_imagenet(path, dtype=np.float32):
   return class_names, X_train, y_train, X_val, y_val, X_test, y_test
 
 
+def pack_tiny_imagenet(path, packed_path, num_workers=None):
+  """
+  Convert a TinyImageNet directory into a packed archive that can be opened
+  with load_tiny_imagenet_packed.
+
+  The archive is a directory holding images.npy, a single contiguous uint8
+  array of shape (N_tr + N_val + N_test, 3, 64, 64) with the training,
+  validation and test images in that order, and index.pkl, a pickled
+  dictionary with the labels, the split sizes, the wnids, the class names
+  and the mean training image.
+
+  Inputs:
+  - path: String giving path to the TinyImageNet directory to convert.
+  - packed_path: String giving the directory to write the archive to.
+  - num_workers: Number of processes used to decode the images.
+  """
+  class_names, X_train, y_train, X_val, y_val, X_test, y_test = \
+      load_tiny_imagenet(path, dtype=np.uint8, num_workers=num_workers)
+
+  with open(os.path.join(path, 'wnids.txt'), 'r') as f:
+    wnids = [x.strip() for x in f]
+
+  if not os.path.isdir(packed_path):
+    os.makedirs(packed_path)
+
+  splits = [X_train, X_val, X_test]
+  num_images = sum(X.shape[0] for X in splits)
+  images = np.lib.format.open_memmap(os.path.join(packed_path, 'images.npy'),
+                                     mode='w+', dtype=np.uint8,
+                                     shape=(num_images, 3, 64, 64))
+  start = 0
+  for X in splits:
+    images[start:start + X.shape[0]] = X
+    start += X.shape[0]
+  images.flush()
+  del images
+
+  index = {
+    'wnids': wnids,
+    'class_names': class_names,
+    'num_train': X_train.shape[0],
+    'num_val': X_val.shape[0],
+    'num_test': X_test.shape[0],
+    'y_train': y_train,
+    'y_val': y_val,
+    'y_test': y_test,
+    'mean_image': X_train.mean(axis=0, dtype=np.float64).astype(np.float32),
+  }
+  with open(os.path.join(packed_path, 'index.pkl'), 'wb') as f:
+    pickle.dump(index, f, pickle.HIGHEST_PROTOCOL)
+
+
+def load_tiny_imagenet_packed(packed_path):
+  """
+  Open an archive written by pack_tiny_imagenet. The images are memory-mapped
+  read-only, so opening is instant, only the images that are accessed are
+  read from disk, and processes opening the same archive share the page
+  cache.
+
+  Returns: A dictionary with the following entries:
+  - class_names: A list where class_names[i] is a list of strings giving the
+    WordNet names for class i in the loaded dataset.
+  - wnids: A list where wnids[i] is the WordNet id of class i.
+  - X_train: (N_tr, 3, 64, 64) uint8 array of training images
+  - y_train: (N_tr,) array of training labels
+  - X_val: (N_val, 3, 64, 64) uint8 array of validation images
+  - y_val: (N_val,) array of validation labels
+  - X_test: (N_test, 3, 64, 64) uint8 array of testing images.
+  - y_test: (N_test,) array of test labels, or None if they are not available
+  - mean_image: (3, 64, 64) array giving mean training image
+  """
+  with open(os.path.join(packed_path, 'index.pkl'), 'rb') as f:
+    index = pickle.load(f)
+  images = np.load(os.path.join(packed_path, 'images.npy'), mmap_mode='r')
+
+  num_train, num_val = index['num_train'], index['num_val']
+  return {
+    'class_names': index['class_names'],
+    'wnids': index['wnids'],
+    'X_train': images[:num_train],
+    'y_train': index['y_train'],
+    'X_val': images[num_train:num_train + num_val],
+    'y_val': index['y_val'],
+    'X_test': images[num_train + num_val:],
+    'y_test': index['y_test'],
+    'mean_image': index['mean_image'],
+  }
+
+
+def sample_tiny_imagenet_minibatch(data, batch_size=100, split='train',
+                                   dtype=np.float32, subtract_mean=True):
+  """
+  Sample a random minibatch from a dataset opened by load_tiny_imagenet_packed.
+  Only the sampled images are read and converted to dtype.
+
+  Returns a tuple of:
+  - X_batch: (batch_size, 3, 64, 64) array of images
+  - y_batch: (batch_size,) array of labels, or None if the split has no labels
+  """
+  X = data['X_%s' % split]
+  y = data['y_%s' % split]
+  # Reading the rows in file order keeps the accesses to the mapping sequential
+  mask = np.sort(np.random.choice(X.shape[0], batch_size))
+  X_batch = X[mask].astype(dtype)
+  if subtract_mean:
+    X_batch -= data['mean_image']
+  y_batch = None if y is None else y[mask]
+  return X_batch, y_batch
+
+
+class ModelRegistry(object):
+  """
+  A lazily loaded view of a directory of saved models.
+
+  Building the registry only lists the directory, so it is cheap even for a
+  large model zoo. A model is read from disk the first time it is accessed
+  and is then kept in an LRU cache holding at most max_bytes of parameters.
+
+  Two formats are understood:
+  - A pickled dictionary with a 'model' field, as read by load_models.
+  - A packed model directory written by pack(), holding a meta.pkl file and
+    one .npy file per array parameter. Packed parameters are memory-mapped
+    read-only instead of being read into memory.
+
+  Example usage:
+
+  registry = ModelRegistry('cs231n/datasets/tiny-100-A-pretrained')
+  print registry.keys()
+  model = registry['model1.pkl']
+  """
+
+  def __init__(self, models_dir, max_bytes=1 << 30):
+    """
+    Inputs:
+    - models_dir: String giving the path to a directory containing models.
+    - max_bytes: Maximum total size in bytes of the parameters kept in the
+      cache, or None for no limit. The most recently used model is always
+      kept even if it alone is larger than max_bytes.
+    """
+    self.models_dir = models_dir
+    self.max_bytes = max_bytes
+    self._cache = OrderedDict()
+    self._cache_bytes = 0
+    self.refresh()
+
+
+  def refresh(self):
+    """
+    Rebuild the index from the directory listing; nothing is unpickled.
+    Cached models whose files changed or disappeared are dropped.
+    """
+    index = {}
+    for name in os.listdir(self.models_dir):
+      path = os.path.join(self.models_dir, name)
+      if os.path.isdir(path):
+        if not os.path.isfile(os.path.join(path, 'meta.pkl')):
+          continue
+        fmt = 'packed'
+      else:
+        fmt = 'pickle'
+      st = os.stat(path)
+      index[name] = {'path': path, 'format': fmt, 'size': st.st_size,
+                     'mtime': st.st_mtime}
+
+    old_index = getattr(self, 'index', {})
+    for name in list(self._cache):
+      if index.get(name) != old_index.get(name):
+        self._evict(name)
+    self.index = index
+
+
+  def keys(self):
+    return sorted(self.index)
+
+
+  def __iter__(self):
+    return iter(self.keys())
+
+
+  def __len__(self):
+    return len(self.index)
+
+
+  def __contains__(self, name):
+    return name in self.index
+
+
+  def metadata(self, name):
+    """
+    Return a dictionary of metadata for a model without loading its
+    parameters: the index entry, plus for packed models the non-array fields
+    stored alongside the parameters.
+    """
+    entry = self.index[name]
+    meta = dict(entry)
+    if entry['format'] == 'packed':
+      with open(os.path.join(entry['path'], 'meta.pkl'), 'rb') as f:
+        meta.update(pickle.load(f)['fields'])
+    return meta
+
+
+  def __getitem__(self, name):
+    if name in self._cache:
+      self._cache[name] = self._cache.pop(name)
+      return self._cache[name]
+    entry = self.index[name]
+    if entry['format'] == 'packed':
+      model = self._load_packed(entry['path'])
+    else:
+      with open(entry['path'], 'rb') as f:
+        model = pickle.load(f)['model']
+    self._insert(name, model)
+    return model
+
+
+  def pack(self, name):
+    """
+    Convert a pickled model into the packed format so that later loads
+    memory-map its parameters. The packed model is written to a directory
+    named name + '.packed' and added to the index under that name, which is
+    returned.
+    """
+    entry = self.index[name]
+    if entry['format'] == 'packed':
+      return name
+    with open(entry['path'], 'rb') as f:
+      saved = pickle.load(f)
+    model = saved.pop('model')
+
+    packed_name = name + '.packed'
+    path = os.path.join(self.models_dir, packed_name)
+    if not os.path.isdir(path):
+      os.makedirs(path)
+    arrays, others = [], {}
+    for k, v in model.iteritems():
+      if isinstance(v, np.ndarray):
+        np.save(os.path.join(path, '%s.npy' % k), v)
+        arrays.append(k)
+      else:
+        others[k] = v
+    meta = {'arrays': arrays, 'others': others, 'fields': saved}
+    with open(os.path.join(path, 'meta.pkl'), 'wb') as f:
+      pickle.dump(meta, f, pickle.HIGHEST_PROTOCOL)
+
+    self.refresh()
+    return packed_name
+
+
+  def _load_packed(self, path):
+    with open(os.path.join(path, 'meta.pkl'), 'rb') as f:
+      meta = pickle.load(f)
+    model = dict(meta['others'])
+    for k in meta['arrays']:
+      model[k] = np.load(os.path.join(path, '%s.npy' % k), mmap_mode='r')
+    return model
+
+
+  def _insert(self, name, model):
+    self._cache[name] = model
+    self._cache_bytes += _model_nbytes(model)
+    if self.max_bytes is None:
+      return
+    while self._cache_bytes > self.max_bytes and len(self._cache) > 1:
+      self._evict(next(iter(self._cache)))
+
+
+  def _evict(self, name):
+    model = self._cache.pop(name)
+    self._cache_bytes -= _model_nbytes(model)
+
+
+def _model_nbytes(model):
+  """ Total size in bytes of the array parameters of a model """
+  return sum(v.nbytes for v in model.itervalues() if isinstance(v, np.ndarray))
+
+
 def load_models(models_dir):
   """
   Load saved models from disk. This will attempt to unpickle all files in a
   directory; any files that give errors on unpickling (such as README.txt) will
   be skipped.
 
+  This reads every model up front; use ModelRegistry to load models on
+  demand.
+
   Inputs:
   - models_dir: String giving the path to a directory containing model files.
     Each model file is a pickled dictionary with a 'model' field.
@@ -189,11 +669,11 @@ def load_models(models_dir):
   Returns:
   A dictionary mapping model file names to models.
   """
+  registry = ModelRegistry(models_dir, max_bytes=None)
   models = {}
-  for model_file in os.listdir(models_dir):
-    with open(os.path.join(models_dir, model_file), 'rb') as f:
-      try:
-        models[model_file] = pickle.load(f)['model']
-      except pickle.UnpicklingError:
-        continue
+  for model_file in registry:
+    try:
+      models[model_file] = registry[model_file]
+    except pickle.UnpicklingError:
+      continue
   return models
@@ -1,13 +1,183 @@
+import multiprocessing
+import os
+import threading
+import timeit
+import cPickle as pickle
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
 import numpy as np
 try:
   from cs231n.im2col_cython import col2im_cython, im2col_cython
   from cs231n.im2col_cython import col2im_6d_cython
+  from cs231n.im2col_cython import im2col_cython_parallel
+  from cs231n.im2col_cython import col2im_cython_parallel
+  from cs231n.im2col_cython import col2im_6d_cython_parallel
 except ImportError:
   print 'run the following from the cs231n directory and try again:'
   print 'python setup.py build_ext --inplace'
   print 'You may also need to restart your iPython kernel'
+  print 'Using the slower pure numpy versions of the im2col kernels for now'
+  from cs231n.im2col import im2col_strided, col2im_strided, col2im_6d_strided
+  im2col_cython = im2col_cython_parallel = im2col_strided
+  col2im_cython = col2im_cython_parallel = col2im_strided
+  col2im_6d_cython = col2im_6d_cython_parallel = col2im_6d_strided
 
 from cs231n.im2col import *
+from cs231n.workspace import workspace
+
+# Only the layers and the autotuner are exported by "from fast_layers import *";
+# the standard library modules imported above would otherwise shadow names in
+# the modules and notebooks that star-import this one.
+__all__ = [
+  'conv_forward_im2col', 'conv_backward_im2col',
+  'conv_forward_strides', 'conv_backward_strides',
+  'conv_forward_nhwc', 'conv_backward_nhwc',
+  'conv_forward_grouped', 'conv_backward_grouped',
+  'conv_forward_threaded', 'conv_backward_threaded',
+  'conv_forward_winograd', 'conv_backward_winograd',
+  'WINOGRAD_TRANSFORMS', 'winograd_multiply_reduction',
+  'conv_forward_fft', 'conv_backward_fft',
+  'FFT_FILTER_CACHE_SIZE', 'clear_fft_filter_cache',
+  'conv_forward_autotune', 'conv_backward_autotune',
+  'CONV_ALGORITHMS', 'CONV_AUTOTUNE_FILE', 'CONV_AUTOTUNE_SKIP_FLOAT32',
+  'time_conv_algorithms', 'select_conv_algorithm', 'conv_autotune_info',
+  'clear_conv_autotune',
+  'conv_forward_fast', 'conv_backward_fast',
+  'max_pool_forward_fast', 'max_pool_backward_fast',
+  'max_pool_forward_reshape', 'max_pool_backward_reshape',
+  'max_pool_forward_strided', 'max_pool_backward_strided',
+  'max_pool_forward_nhwc', 'max_pool_backward_nhwc',
+  'max_pool_forward_im2col', 'max_pool_backward_im2col',
+  'conv_relu_pool_forward_fast', 'conv_relu_pool_backward_fast',
+]
+
+
+def _dot_into_workspace(a, b):
+  """
+  Return a.dot(b) for 2D arrays, computed into a buffer from the workspace
+  pool; give the result back with workspace.release when done with it.
+  """
+  out = workspace.get((a.shape[0], b.shape[1]), np.result_type(a, b))
+  return np.dot(a, b, out=out)
+
+
+def _pad_into_workspace(x, pad):
+  """
+  Return a zero-padded copy of x of shape (N, C, H + 2 * pad, W + 2 * pad)
+  in a buffer from the workspace pool; only the border is zeroed.
+  """
+  N, C, H, W = x.shape
+  x_padded = workspace.get((N, C, H + 2 * pad, W + 2 * pad), x.dtype)
+  if pad > 0:
+    x_padded[:, :, :pad] = 0
+    x_padded[:, :, -pad:] = 0
+    x_padded[:, :, pad:-pad, :pad] = 0
+    x_padded[:, :, pad:-pad, -pad:] = 0
+  x_padded[:, :, pad:pad + H, pad:pad + W] = x
+  return x_padded
+
+
+def _low_memory(conv_param):
+  """
+  Whether a convolutional layer should run in low-memory mode, where the
+  forward pass caches only x and the backward pass recomputes what it needs
+  from it (such as x_cols) instead of keeping it between the two passes.
+  Set conv_param['low_memory'] for a single layer, or the environment
+  variable CS231N_CONV_LOW_MEMORY=1 for every layer that does not set it.
+  """
+  low_memory = conv_param.get('low_memory')
+  if low_memory is None:
+    low_memory = os.environ.get('CS231N_CONV_LOW_MEMORY', '0') not in ('', '0')
+  return low_memory
+
+
+def _layout(param):
+  """
+  Return the memory layout of the activations of a layer, given by the
+  'layout' key of its conv_param or pool_param: 'NCHW', the default, or
+  'NHWC' for channels-last data.
+  """
+  layout = param.get('layout', 'NCHW')
+  if layout not in ('NCHW', 'NHWC'):
+    raise ValueError('Unknown layout "%s"' % layout)
+  return layout
+
+
+def _im2col_strides(x, HH, WW, pad, stride, out=None):
+  """
+  im2col by picking clever strides on the padded input; returns x_cols of
+  shape (C * HH * WW, N * out_h * out_w), written into out if given.
+  """
+  N, C, H, W = x.shape
+  x_padded = _pad_into_workspace(x, pad)
+
+  # Figure out output dimensions
+  H += 2 * pad
+  W += 2 * pad
+  out_h = (H - HH) / stride + 1
+  out_w = (W - WW) / stride + 1
+
+  shape = (C, HH, WW, N, out_h, out_w)
+  strides = (H * W, W, 1, C * H * W, stride * W, stride)
+  strides = x.itemsize * np.array(strides)
+  x_stride = np.lib.stride_tricks.as_strided(x_padded,
+                shape=shape, strides=strides)
+  if out is None:
+    out = np.empty((C * HH * WW, N * out_h * out_w), dtype=x.dtype)
+  out.reshape(shape)[...] = x_stride
+  workspace.release(x_padded)
+  return out
+
+
+def _im2col_nhwc(x, HH, WW, pad, stride, out=None):
+  """
+  im2col for channels-last data of shape (N, H, W, C); returns x_cols of
+  shape (N * out_h * out_w, HH * WW * C), written into out if given. Each row
+  is the receptive field of one output pixel, so multiplying x_cols by the
+  filters gives the output already in NHWC order.
+  """
+  N, H, W, C = x.shape
+  x_padded = x
+  if pad > 0:
+    x_padded = workspace.get((N, H + 2 * pad, W + 2 * pad, C), x.dtype)
+    x_padded[:, :pad] = 0
+    x_padded[:, -pad:] = 0
+    x_padded[:, pad:-pad, :pad] = 0
+    x_padded[:, pad:-pad, -pad:] = 0
+    x_padded[:, pad:-pad, pad:-pad] = x
+
+  out_h = (H + 2 * pad - HH) / stride + 1
+  out_w = (W + 2 * pad - WW) / stride + 1
+  shape = (N, out_h, out_w, HH, WW, C)
+  sN, sH, sW, sC = x_padded.strides
+  x_stride = np.lib.stride_tricks.as_strided(x_padded, shape=shape,
+                strides=(sN, stride * sH, stride * sW, sH, sW, sC))
+  if out is None:
+    out = np.empty((N * out_h * out_w, HH * WW * C), dtype=x.dtype)
+  out.reshape(shape)[...] = x_stride
+  if pad > 0:
+    workspace.release(x_padded)
+  return out
+
+
+def _col2im_nhwc(cols, x_shape, HH, WW, pad, stride):
+  """
+  The adjoint of _im2col_nhwc: sum the rows of cols back into an array of
+  shape x_shape = (N, H, W, C), adding one strided slice per filter tap.
+  """
+  N, H, W, C = x_shape
+  out_h = (H + 2 * pad - HH) / stride + 1
+  out_w = (W + 2 * pad - WW) / stride + 1
+  cols = cols.reshape(N, out_h, out_w, HH, WW, C)
+  x_padded = np.zeros((N, H + 2 * pad, W + 2 * pad, C), dtype=cols.dtype)
+  for hh in xrange(HH):
+    for ww in xrange(WW):
+      x_padded[:, hh:hh + stride * out_h:stride,
+               ww:ww + stride * out_w:stride] += cols[:, :, :, hh, ww]
+  if pad > 0:
+    return x_padded[:, pad:-pad, pad:-pad]
+  return x_padded
 
 
 def conv_forward_im2col(x, w, b, conv_param):
@@ -29,12 +199,14 @@ def conv_forward_im2col(x, w, b, conv_param):
   out = np.zeros((N, num_filters, out_height, out_width), dtype=x.dtype)
 
   # x_cols = im2col_indices(x, w.shape[2], w.shape[3], pad, stride)
-  x_cols = im2col_cython(x, w.shape[2], w.shape[3], pad, stride)
+  x_cols = im2col_cython_parallel(x, w.shape[2], w.shape[3], pad, stride)
   res = w.reshape((w.shape[0], -1)).dot(x_cols) + b.reshape(-1, 1)
 
   out = res.reshape(w.shape[0], out.shape[2], out.shape[3], x.shape[0])
   out = out.transpose(3, 0, 1, 2)
 
+  if _low_memory(conv_param):
+    x_cols = None
   cache = (x, w, b, conv_param, x_cols)
   return out, cache
 
@@ -48,36 +220,29 @@ def conv_forward_strides(x, w, b, conv_param):
   assert (W + 2 * pad - WW) % stride == 0, 'width does not work'
   assert (H + 2 * pad - HH) % stride == 0, 'height does not work'
 
-  # Pad the input
-  p = pad
-  x_padded = np.pad(x, ((0, 0), (0, 0), (p, p), (p, p)), mode='constant')
-  
   # Figure out output dimensions
-  H += 2 * pad
-  W += 2 * pad
-  out_h = (H - HH) / stride + 1
-  out_w = (W - WW) / stride + 1
+  out_h = (H + 2 * pad - HH) / stride + 1
+  out_w = (W + 2 * pad - WW) / stride + 1
 
-  # Perform an im2col operation by picking clever strides
-  shape = (C, HH, WW, N, out_h, out_w)
-  strides = (H * W, W, 1, C * H * W, stride * W, stride)
-  strides = x.itemsize * np.array(strides)
-  x_stride = np.lib.stride_tricks.as_strided(x_padded,
-                shape=shape, strides=strides)
-  x_cols = np.ascontiguousarray(x_stride)
-  x_cols.shape = (C * HH * WW, N * out_h * out_w)
+  # Perform an im2col operation by picking clever strides; in low-memory
+  # mode x_cols is only needed for the matrix multiply
+  low_memory = _low_memory(conv_param)
+  x_cols = None
+  if low_memory:
+    x_cols = workspace.get((C * HH * WW, N * out_h * out_w), x.dtype)
+  x_cols = _im2col_strides(x, HH, WW, pad, stride, out=x_cols)
 
   # Now all our convolutions are a big matrix multiply
-  res = w.reshape(F, -1).dot(x_cols) + b.reshape(-1, 1)
+  res = _dot_into_workspace(w.reshape(F, -1), x_cols)
+  if low_memory:
+    workspace.release(x_cols)
+    x_cols = None
 
-  # Reshape the output
-  res.shape = (F, N, out_h, out_w)
-  out = res.transpose(1, 0, 2, 3)
-
-  # Be nice and return a contiguous array
-  # The old version of conv_forward_fast doesn't do this, so for a fair
-  # comparison we won't either
-  out = np.ascontiguousarray(out)
+  # Reshape the output into a contiguous array and add the bias
+  out = np.empty((N, F, out_h, out_w), dtype=np.result_type(res, b))
+  out[...] = res.reshape(F, N, out_h, out_w).transpose(1, 0, 2, 3)
+  out += b.reshape(1, -1, 1, 1)
+  workspace.release(res)
 
   cache = (x, w, b, conv_param, x_cols)
   return out, cache
@@ -94,11 +259,19 @@ def conv_backward_strides(dout, cache):
   db = np.sum(dout, axis=(0, 2, 3))
 
   dout_reshaped = dout.transpose(1, 0, 2, 3).reshape(F, -1)
-  dw = dout_reshaped.dot(x_cols.T).reshape(w.shape)
+  if x_cols is None:
+    # Low-memory mode: recompute x_cols into a scratch buffer
+    x_cols = workspace.get((C * HH * WW, dout_reshaped.shape[1]), x.dtype)
+    _im2col_strides(x, HH, WW, pad, stride, out=x_cols)
+    dw = dout_reshaped.dot(x_cols.T).reshape(w.shape)
+    workspace.release(x_cols)
+  else:
+    dw = dout_reshaped.dot(x_cols.T).reshape(w.shape)
 
-  dx_cols = w.reshape(F, -1).T.dot(dout_reshaped)
-  dx_cols.shape = (C, HH, WW, N, out_h, out_w)
-  dx = col2im_6d_cython(dx_cols, N, C, H, W, HH, WW, pad, stride)
+  dx_cols = _dot_into_workspace(w.reshape(F, -1).T, dout_reshaped)
+  dx = col2im_6d_cython_parallel(dx_cols.reshape(C, HH, WW, N, out_h, out_w),
+                                 N, C, H, W, HH, WW, pad, stride)
+  workspace.release(dx_cols)
 
   return dx, dw, db
 
@@ -114,30 +287,940 @@ def conv_backward_im2col(dout, cache):
   db = np.sum(dout, axis=(0, 2, 3))
 
   num_filters, _, filter_height, filter_width = w.shape
+  if x_cols is None:
+    x_cols = im2col_cython_parallel(x, filter_height, filter_width, pad, stride)
   dout_reshaped = dout.transpose(1, 2, 3, 0).reshape(num_filters, -1)
   dw = dout_reshaped.dot(x_cols.T).reshape(w.shape)
 
-  dx_cols = w.reshape(num_filters, -1).T.dot(dout_reshaped)
+  dx_cols = _dot_into_workspace(w.reshape(num_filters, -1).T, dout_reshaped)
   # dx = col2im_indices(dx_cols, x.shape, filter_height, filter_width, pad, stride)
-  dx = col2im_cython(dx_cols, x.shape[0], x.shape[1], x.shape[2], x.shape[3],
-                     filter_height, filter_width, pad, stride)
+  dx = col2im_cython_parallel(dx_cols, x.shape[0], x.shape[1], x.shape[2],
+                              x.shape[3], filter_height, filter_width, pad,
+                              stride)
+  workspace.release(dx_cols)
 
   return dx, dw, db
 
 
-conv_forward_fast = conv_forward_strides
-conv_backward_fast = conv_backward_strides
+def conv_forward_nhwc(x, w, b, conv_param):
+  """
+  A fast implementation of the forward pass for a convolutional layer on
+  channels-last data, used by conv_forward_fast when conv_param['layout'] is
+  'NHWC'.
+
+  The matrix multiply of _im2col_nhwc columns with the filters produces the
+  output in NHWC order, so unlike conv_forward_strides no transpose of the
+  activations is needed; only the small filter array is reordered.
+
+  Inputs:
+  - x: Input data of shape (N, H, W, C)
+  - w: Filter weights of shape (F, C, HH, WW), the same as for NCHW data
+  - b: Biases, of shape (F,)
+  - conv_param: As for conv_forward_naive
+
+  Returns a tuple of:
+  - out: Output data, of shape (N, H', W', F)
+  - cache: (x, w, b, conv_param, x_cols)
+  """
+  N, H, W, C = x.shape
+  F, _, HH, WW = w.shape
+  stride, pad = conv_param['stride'], conv_param['pad']
+
+  # Check dimensions
+  assert (W + 2 * pad - WW) % stride == 0, 'width does not work'
+  assert (H + 2 * pad - HH) % stride == 0, 'height does not work'
+
+  out_h = (H + 2 * pad - HH) / stride + 1
+  out_w = (W + 2 * pad - WW) / stride + 1
+
+  low_memory = _low_memory(conv_param)
+  x_cols = None
+  if low_memory:
+    x_cols = workspace.get((N * out_h * out_w, HH * WW * C), x.dtype)
+  x_cols = _im2col_nhwc(x, HH, WW, pad, stride, out=x_cols)
+
+  w_cols = w.transpose(2, 3, 1, 0).reshape(-1, F)
+  out = x_cols.dot(w_cols)
+  out += b
+  if low_memory:
+    workspace.release(x_cols)
+    x_cols = None
+
+  cache = (x, w, b, conv_param, x_cols)
+  return out.reshape(N, out_h, out_w, F), cache
+
+
+def conv_backward_nhwc(dout, cache):
+  """
+  A fast implementation of the backward pass for a convolutional layer on
+  channels-last data, matching conv_forward_nhwc. dout has shape
+  (N, H', W', F) and dx has the shape of x, (N, H, W, C).
+  """
+  x, w, b, conv_param, x_cols = cache
+  stride, pad = conv_param['stride'], conv_param['pad']
+
+  N, H, W, C = x.shape
+  F, _, HH, WW = w.shape
+
+  dout_cols = dout.reshape(-1, F)
+  db = np.sum(dout_cols, axis=0)
+
+  if x_cols is None:
+    # Low-memory mode: recompute x_cols into a scratch buffer
+    x_cols = workspace.get((dout_cols.shape[0], HH * WW * C), x.dtype)
+    _im2col_nhwc(x, HH, WW, pad, stride, out=x_cols)
+    dw_cols = x_cols.T.dot(dout_cols)
+    workspace.release(x_cols)
+  else:
+    dw_cols = x_cols.T.dot(dout_cols)
+  dw = np.ascontiguousarray(dw_cols.reshape(HH, WW, C, F).transpose(3, 2, 0, 1))
+
+  w_cols = w.transpose(2, 3, 1, 0).reshape(-1, F)
+  dx_cols = _dot_into_workspace(dout_cols, w_cols.T)
+  dx = _col2im_nhwc(dx_cols, x.shape, HH, WW, pad, stride)
+  workspace.release(dx_cols)
+
+  return dx, dw, db
+
+
+def _groups(x, w, conv_param):
+  """
+  Return the number of groups of a convolutional layer, conv_param['groups']
+  (1 by default), after checking that it fits the shapes of x and w.
+  """
+  groups = conv_param.get('groups', 1)
+  C, F = x.shape[1], w.shape[0]
+  assert C % groups == 0, 'channels do not split into groups'
+  assert F % groups == 0, 'filters do not split into groups'
+  assert w.shape[1] == C / groups, 'filters do not match groups'
+  return groups
+
+
+def conv_forward_grouped(x, w, b, conv_param):
+  """
+  A fast implementation of the forward pass for a grouped convolution.
+
+  With conv_param['groups'] = G the C input channels and F filters are split
+  into G groups, and the filters of group g only see the C / G input
+  channels of group g, so w has shape (F, C / G, HH, WW). G = C gives a
+  depthwise convolution, where every filter sees a single channel.
+
+  Depthwise layers are computed directly as one strided multiply-add per
+  filter tap, and cache only x. Other grouped layers build the im2col matrix
+  of the whole input once, whose rows are already ordered by group, and do
+  one matrix multiply per group.
+
+  Returns a tuple of:
+  - out: Output data, of shape (N, F, H', W')
+  - cache: (method, real_cache), where method is 'depthwise' or 'gemm'
+  """
+  N, C, H, W = x.shape
+  F, _, HH, WW = w.shape
+  stride, pad = conv_param['stride'], conv_param['pad']
+  groups = _groups(x, w, conv_param)
+
+  # Check dimensions
+  assert (W + 2 * pad - WW) % stride == 0, 'width does not work'
+  assert (H + 2 * pad - HH) % stride == 0, 'height does not work'
+
+  out_h = (H + 2 * pad - HH) / stride + 1
+  out_w = (W + 2 * pad - WW) / stride + 1
+
+  if groups == C:
+    return _conv_forward_depthwise(x, w, b, conv_param, out_h, out_w)
+
+  low_memory = _low_memory(conv_param)
+  x_cols = None
+  if low_memory:
+    x_cols = workspace.get((C * HH * WW, N * out_h * out_w), x.dtype)
+  x_cols = _im2col_strides(x, HH, WW, pad, stride, out=x_cols)
+
+  # The rows of x_cols for group g are rows g * C / G * HH * WW onwards
+  res = _batched_dot(w.reshape(groups, F / groups, -1),
+                     x_cols.reshape(groups, -1, x_cols.shape[1]))
+  if low_memory:
+    workspace.release(x_cols)
+    x_cols = None
+
+  out = np.empty((N, F, out_h, out_w), dtype=np.result_type(res, b))
+  out[...] = res.reshape(F, N, out_h, out_w).transpose(1, 0, 2, 3)
+  out += b.reshape(1, -1, 1, 1)
+
+  cache = ('gemm', (x, w, b, conv_param, x_cols))
+  return out, cache
+
+
+def conv_backward_grouped(dout, cache):
+  """
+  A fast implementation of the backward pass for a grouped convolution,
+  matching conv_forward_grouped.
+  """
+  method, real_cache = cache
+  if method == 'depthwise':
+    return _conv_backward_depthwise(dout, real_cache)
+  elif method != 'gemm':
+    raise ValueError('Unrecognized method "%s"' % method)
+
+  x, w, b, conv_param, x_cols = real_cache
+  stride, pad = conv_param['stride'], conv_param['pad']
+  groups = conv_param['groups']
+
+  N, C, H, W = x.shape
+  F, _, HH, WW = w.shape
+  _, _, out_h, out_w = dout.shape
+
+  db = np.sum(dout, axis=(0, 2, 3))
+
+  recompute = x_cols is None
+  if recompute:
+    # Low-memory mode: recompute x_cols into a scratch buffer
+    x_cols = workspace.get((C * HH * WW, N * out_h * out_w), x.dtype)
+    _im2col_strides(x, HH, WW, pad, stride, out=x_cols)
+  dout_groups = dout.transpose(1, 0, 2, 3).reshape(groups, F / groups, -1)
+  x_groups = x_cols.reshape(groups, -1, x_cols.shape[1])
+  dw = _batched_dot(dout_groups, x_groups.transpose(0, 2, 1)).reshape(w.shape)
+  if recompute:
+    workspace.release(x_cols)
+
+  w_groups = w.reshape(groups, F / groups, -1)
+  dx_cols = _batched_dot(w_groups.transpose(0, 2, 1), dout_groups)
+  dx = col2im_6d_cython_parallel(dx_cols.reshape(C, HH, WW, N, out_h, out_w),
+                                 N, C, H, W, HH, WW, pad, stride)
+
+  return dx, dw, db
+
+
+def _conv_forward_depthwise(x, w, b, conv_param, out_h, out_w):
+  """
+  Depthwise convolution, with F = k * C filters of which filters
+  c * k to (c + 1) * k - 1 see input channel c. The output is accumulated
+  one filter tap at a time from strided views of the padded input.
+  """
+  N, C, H, W = x.shape
+  F, _, HH, WW = w.shape
+  stride, pad = conv_param['stride'], conv_param['pad']
+  k = F / C
+
+  x_padded = _pad_into_workspace(x, pad)
+  w_taps = w.reshape(C, k, 1, 1, HH, WW)
+  out = np.zeros((N, C, k, out_h, out_w), dtype=np.result_type(x, w))
+  prod = workspace.get(out.shape, out.dtype)
+  for hh in xrange(HH):
+    for ww in xrange(WW):
+      tap = x_padded[:, :, np.newaxis, hh:hh + stride * out_h:stride,
+                     ww:ww + stride * out_w:stride]
+      np.multiply(tap, w_taps[:, :, :, :, hh, ww], out=prod)
+      out += prod
+  workspace.release(x_padded, prod)
+
+  out = out.reshape(N, F, out_h, out_w)
+  out += b.reshape(1, -1, 1, 1)
+  cache = ('depthwise', (x, w, b, conv_param))
+  return out, cache
+
+
+def _conv_backward_depthwise(dout, cache):
+  x, w, b, conv_param = cache
+  stride, pad = conv_param['stride'], conv_param['pad']
+
+  N, C, H, W = x.shape
+  F, _, HH, WW = w.shape
+  _, _, out_h, out_w = dout.shape
+  k = F / C
+
+  db = np.sum(dout, axis=(0, 2, 3))
+
+  x_padded = _pad_into_workspace(x, pad)
+  dout = dout.reshape(N, C, k, out_h, out_w)
+  w_taps = w.reshape(C, k, HH, WW)
+  dw = np.empty((C, k, HH, WW), dtype=w.dtype)
+  dx_padded = np.zeros(x_padded.shape, dtype=np.result_type(dout, w))
+  for hh in xrange(HH):
+    for ww in xrange(WW):
+      window = (slice(None), slice(None),
+                slice(hh, hh + stride * out_h, stride),
+                slice(ww, ww + stride * out_w, stride))
+      dw[:, :, hh, ww] = np.einsum('nckhw,nchw->ck', dout, x_padded[window])
+      dx_padded[window] += np.einsum('nckhw,ck->nchw', dout,
+                                     w_taps[:, :, hh, ww])
+  workspace.release(x_padded)
+
+  dx = dx_padded
+  if pad > 0:
+    dx = dx_padded[:, :, pad:-pad, pad:-pad]
+  return dx, dw.reshape(w.shape), db
+
+
+# Thread pools used by conv_forward_threaded, one per number of threads; they
+# are created on first use and kept for the lifetime of the process.
+_thread_pools = {}
+_thread_pools_lock = threading.Lock()
+
+
+def _num_threads(conv_param):
+  """
+  The number of threads that conv_forward_threaded splits a minibatch over:
+  conv_param['num_threads'], else the environment variable
+  CS231N_CONV_THREADS, else the number of CPUs.
+  """
+  num_threads = conv_param.get('num_threads')
+  if not num_threads:
+    num_threads = int(os.environ.get('CS231N_CONV_THREADS') or 0)
+  return num_threads or multiprocessing.cpu_count()
+
+
+def _map_shards(func, num_shards):
+  """
+  Return [func(i) for i in xrange(num_shards)], with the calls spread over a
+  pool of num_shards threads.
+  """
+  if num_shards == 1:
+    return [func(0)]
+  with _thread_pools_lock:
+    pool = _thread_pools.get(num_shards)
+    if pool is None:
+      pool = _thread_pools[num_shards] = ThreadPool(num_shards)
+  return pool.map(func, xrange(num_shards))
+
+
+def conv_forward_threaded(x, w, b, conv_param):
+  """
+  A fast implementation of the forward pass for a convolutional layer that
+  splits the minibatch into one shard of images per thread.
+
+  Every shard runs its own im2col, matrix multiply and bias add, and writes
+  into its own slice of the preallocated output, so the threads never share
+  any writes. This parallelizes the whole layer rather than only the matrix
+  multiply; numpy and BLAS release the GIL while they run. For the best
+  scaling limit BLAS to one thread per call, for example with
+  OPENBLAS_NUM_THREADS=1, so that the shards do not oversubscribe the CPUs.
+
+  The number of threads is conv_param['num_threads'], else the environment
+  variable CS231N_CONV_THREADS, else the number of CPUs.
+  """
+  N, C, H, W = x.shape
+  F, _, HH, WW = w.shape
+  stride, pad = conv_param['stride'], conv_param['pad']
+
+  # Check dimensions
+  assert (W + 2 * pad - WW) % stride == 0, 'width does not work'
+  assert (H + 2 * pad - HH) % stride == 0, 'height does not work'
+
+  out_h = (H + 2 * pad - HH) / stride + 1
+  out_w = (W + 2 * pad - WW) / stride + 1
+
+  num_shards = min(_num_threads(conv_param), N)
+  bounds = [N * i / num_shards for i in xrange(num_shards + 1)]
+  shards = zip(bounds[:-1], bounds[1:])
+  low_memory = _low_memory(conv_param)
+  w_cols = w.reshape(F, -1)
+  out = np.empty((N, F, out_h, out_w), dtype=np.result_type(x, w, b))
+
+  def forward_shard(i):
+    start, end = shards[i]
+    x_cols = None
+    if low_memory:
+      x_cols = workspace.get((C * HH * WW, (end - start) * out_h * out_w),
+                             x.dtype)
+    x_cols = _im2col_strides(x[start:end], HH, WW, pad, stride, out=x_cols)
+    res = _dot_into_workspace(w_cols, x_cols)
+    out_shard = out[start:end]
+    out_shard[...] = res.reshape(F, -1, out_h, out_w).transpose(1, 0, 2, 3)
+    out_shard += b.reshape(1, -1, 1, 1)
+    workspace.release(res)
+    if low_memory:
+      workspace.release(x_cols)
+      x_cols = None
+    return x_cols
+
+  x_cols = _map_shards(forward_shard, num_shards)
+  cache = (x, w, b, conv_param, shards, x_cols)
+  return out, cache
+
+
+def conv_backward_threaded(dout, cache):
+  """
+  A fast implementation of the backward pass for a convolutional layer,
+  matching conv_forward_threaded. Every shard writes its own slice of dx and
+  computes its own part of dw; the parts are summed at the end.
+  """
+  x, w, b, conv_param, shards, x_cols = cache
+  stride, pad = conv_param['stride'], conv_param['pad']
+
+  N, C, H, W = x.shape
+  F, _, HH, WW = w.shape
+  _, _, out_h, out_w = dout.shape
+
+  w_cols = w.reshape(F, -1)
+  dx = np.empty(x.shape, dtype=np.result_type(dout, w))
+
+  def backward_shard(i):
+    start, end = shards[i]
+    n = end - start
+    dout_cols = dout[start:end].transpose(1, 0, 2, 3).reshape(F, -1)
+    if x_cols[i] is None:
+      # Low-memory mode: recompute x_cols into a scratch buffer
+      shard_cols = workspace.get((C * HH * WW, n * out_h * out_w), x.dtype)
+      _im2col_strides(x[start:end], HH, WW, pad, stride, out=shard_cols)
+      dw = dout_cols.dot(shard_cols.T)
+      workspace.release(shard_cols)
+    else:
+      dw = dout_cols.dot(x_cols[i].T)
+
+    dx_cols = _dot_into_workspace(w_cols.T, dout_cols)
+    dx[start:end] = col2im_6d_strided(
+        dx_cols.reshape(C, HH, WW, n, out_h, out_w),
+        n, C, H, W, HH, WW, pad, stride)
+    workspace.release(dx_cols)
+    return dw
+
+  dw_shards = _map_shards(backward_shard, len(shards))
+  dw = dw_shards[0]
+  for dw_shard in dw_shards[1:]:
+    dw += dw_shard
+  db = np.sum(dout, axis=(0, 2, 3))
+
+  return dx, dw.reshape(w.shape), db
+
+
+# Transforms for Winograd minimal filtering F(m x m, 3 x 3), from
+# Lavin and Gray, "Fast Algorithms for Convolutional Neural Networks", 2015.
+# Each entry is (B^T, G, A^T) for an output tile of size m x m computed from an
+# input tile of size (m + 2) x (m + 2).
+WINOGRAD_TRANSFORMS = {
+  2: (np.array([[1, 0, -1, 0],
+                [0, 1, 1, 0],
+                [0, -1, 1, 0],
+                [0, 1, 0, -1]], dtype=np.float64),
+      np.array([[1, 0, 0],
+                [0.5, 0.5, 0.5],
+                [0.5, -0.5, 0.5],
+                [0, 0, 1]], dtype=np.float64),
+      np.array([[1, 1, 1, 0],
+                [0, 1, -1, -1]], dtype=np.float64)),
+  4: (np.array([[4, 0, -5, 0, 1, 0],
+                [0, -4, -4, 1, 1, 0],
+                [0, 4, -4, -1, 1, 0],
+                [0, -2, -1, 2, 1, 0],
+                [0, 2, -1, -2, 1, 0],
+                [0, 4, 0, -5, 0, 1]], dtype=np.float64),
+      np.array([[1 / 4.0, 0, 0],
+                [-1 / 6.0, -1 / 6.0, -1 / 6.0],
+                [-1 / 6.0, 1 / 6.0, -1 / 6.0],
+                [1 / 24.0, 1 / 12.0, 1 / 6.0],
+                [1 / 24.0, -1 / 12.0, 1 / 6.0],
+                [0, 0, 1]], dtype=np.float64),
+      np.array([[1, 1, 1, 1, 1, 0],
+                [0, 1, -1, 2, -2, 0],
+                [0, 1, 1, 4, 4, 0],
+                [0, 1, -1, 8, -8, 1]], dtype=np.float64)),
+}
+
+
+def winograd_multiply_reduction(m):
+  """
+  Ratio between the multiplies of a direct 3x3 convolution and of Winograd
+  F(m x m, 3 x 3) per output tile, ignoring the transforms: 2.25 for m=2 and
+  4 for m=4.
+  """
+  a = m + 2
+  return (m * m * 9.0) / (a * a)
+
+
+def _winograd_transform(T, d):
+  """
+  Compute T d T^T over the first two axes of d, which must have shape
+  (k, k, ...) where T has shape (p, k). The result has shape (p, p, ...).
+  """
+  p, k = T.shape
+  rest = d.shape[2:]
+  t = np.dot(T, d.reshape(k, -1)).reshape(p, k, -1)
+  t = np.dot(T, t.transpose(1, 0, 2).reshape(k, -1)).reshape(p, p, -1)
+  return np.ascontiguousarray(t.transpose(1, 0, 2)).reshape((p, p) + rest)
+
+
+def _batched_dot(A, B):
+  """
+  Matrix multiply A[i] with B[i] for every index i over the leading axes of A
+  and B, with one BLAS call each; np.matmul does not use BLAS for stacks of
+  matrices in older versions of numpy.
+  """
+  lead_shape = A.shape[:-2]
+  A = A.reshape((-1,) + A.shape[-2:])
+  B = B.reshape((-1,) + B.shape[-2:])
+  out = np.empty((A.shape[0], A.shape[1], B.shape[2]),
+                 dtype=np.result_type(A, B))
+  for i in xrange(out.shape[0]):
+    np.dot(A[i], B[i], out=out[i])
+  return out.reshape(lead_shape + out.shape[1:])
+
+
+def _winograd_input_transform(x, pad, m):
+  """
+  Return V = B^T d B for every a x a input tile d of x, laid out as an array
+  of shape (a, a, C, P), where a = m + 2 and P is the number of tiles.
+  """
+  N, C, H, W = x.shape
+  BT = WINOGRAD_TRANSFORMS[m][0].astype(x.dtype)
+  a = m + 2
+
+  # Pad the input so that the output is a whole number of m x m tiles
+  out_h = H + 2 * pad - 2
+  out_w = W + 2 * pad - 2
+  tiles_h = (out_h + m - 1) / m
+  tiles_w = (out_w + m - 1) / m
+  x_padded = workspace.get((N, C, tiles_h * m + 2, tiles_w * m + 2), x.dtype,
+                           zero=True)
+  x_padded[:, :, pad:pad + H, pad:pad + W] = x
+
+  # Gather the overlapping a x a input tiles with stride m into an array of
+  # shape (a, a, C, P), so that every transform below is a plain GEMM
+  sN, sC, sH, sW = x_padded.strides
+  d = np.lib.stride_tricks.as_strided(x_padded,
+        shape=(a, a, C, N, tiles_h, tiles_w),
+        strides=(sH, sW, sC, sN, m * sH, m * sW))
+  d_tiles = workspace.get(d.shape, x.dtype)
+  d_tiles[...] = d
+  workspace.release(x_padded)
+
+  V = _winograd_transform(BT, d_tiles.reshape(a, a, C, -1))
+  workspace.release(d_tiles)
+  return V
+
+
+def _winograd_conv(x, w, pad, m):
+  """
+  Stride-1 convolution of x with 3x3 filters w using Winograd F(m x m, 3 x 3).
+
+  Returns a tuple of:
+  - out: Output of shape (N, F, H + 2 * pad - 2, W + 2 * pad - 2), without bias
+  - V: Transformed input tiles of shape (a, a, C, P), where a = m + 2 and P is
+    the number of tiles; the backward pass needs these for dw.
+  """
+  N, C, H, W = x.shape
+  F = w.shape[0]
+  G, AT = [t.astype(x.dtype) for t in WINOGRAD_TRANSFORMS[m][1:]]
+  out_h = H + 2 * pad - 2
+  out_w = W + 2 * pad - 2
+  tiles_h = (out_h + m - 1) / m
+  tiles_w = (out_w + m - 1) / m
+
+  # V = B^T d B for every tile and U = G g G^T for every filter
+  V = _winograd_input_transform(x, pad, m)
+  U = _winograd_transform(G, w.transpose(2, 3, 0, 1))
+
+  # One (F, C) x (C, P) matrix multiply per point of the transformed tile
+  M = _batched_dot(U, V)
+
+  # Y = A^T M A, then put the m x m output tiles back in place
+  Y = _winograd_transform(AT, M).reshape(m, m, F, N, tiles_h, tiles_w)
+  out = Y.transpose(3, 2, 4, 0, 5, 1).reshape(N, F, tiles_h * m, tiles_w * m)
+  return np.ascontiguousarray(out[:, :, :out_h, :out_w]), V
+
+
+def conv_forward_winograd(x, w, b, conv_param):
+  """
+  A fast implementation of the forward pass for a convolutional layer with
+  3x3 filters and stride 1, based on Winograd minimal filtering.
+
+  conv_param may contain 'winograd_tile', the size m of the output tiles: 2
+  (the default) uses F(2x2, 3x3), which needs 2.25x fewer multiplies than a
+  direct convolution; 4 uses F(4x4, 3x3), which needs 4x fewer but is less
+  accurate in float32.
+  """
+  stride, pad = conv_param['stride'], conv_param['pad']
+  m = conv_param.get('winograd_tile', 2)
+  assert stride == 1, 'Winograd convolution requires stride 1'
+  assert w.shape[2] == w.shape[3] == 3, \
+    'Winograd convolution requires 3x3 filters'
+  assert m in WINOGRAD_TRANSFORMS, 'Invalid winograd_tile %d' % m
+
+  out, V = _winograd_conv(x, w, pad, m)
+  out += b.reshape(1, -1, 1, 1)
+
+  if _low_memory(conv_param):
+    V = None
+  cache = (x, w, conv_param, V)
+  return out, cache
+
+
+def conv_backward_winograd(dout, cache):
+  """
+  A fast implementation of the backward pass for a convolutional layer with
+  3x3 filters and stride 1, based on Winograd minimal filtering.
+
+  dw is computed in the Winograd domain from the transformed input tiles
+  saved by the forward pass; dx is the full convolution of dout with the
+  flipped filters, which is again a stride-1 3x3 convolution.
+  """
+  x, w, conv_param, V = cache
+  pad = conv_param['pad']
+  m = conv_param.get('winograd_tile', 2)
+  N, C, H, W = x.shape
+  if V is None:
+    V = _winograd_input_transform(x, pad, m)
+  F = w.shape[0]
+  _, _, out_h, out_w = dout.shape
+  BT, G, AT = [t.astype(dout.dtype) for t in WINOGRAD_TRANSFORMS[m]]
+
+  db = np.sum(dout, axis=(0, 2, 3))
+
+  # Cut dout into the same m x m tiles as the forward output, laid out as
+  # (m, m, F, P), and take it back through the output transform: dM = A dY A^T
+  tiles_h = (out_h + m - 1) / m
+  tiles_w = (out_w + m - 1) / m
+  dout_tiled = workspace.get((N, F, tiles_h * m, tiles_w * m), dout.dtype,
+                             zero=True)
+  dout_tiled[:, :, :out_h, :out_w] = dout
+  dY = dout_tiled.reshape(N, F, tiles_h, m, tiles_w, m)
+  dY = np.ascontiguousarray(dY.transpose(3, 5, 1, 0, 2, 4))
+  workspace.release(dout_tiled)
+  dM = _winograd_transform(AT.T, dY.reshape(m, m, F, -1))
+
+  # dU = dM V^T, then back through the filter transform: dw = G^T dU G
+  dU = _batched_dot(dM, V.transpose(0, 1, 3, 2))
+  dw = _winograd_transform(G.T, dU).transpose(2, 3, 0, 1)
+
+  # Full convolution of dout with the flipped, transposed filters
+  w_flipped = w[:, :, ::-1, ::-1].transpose(1, 0, 2, 3)
+  dx_padded, _ = _winograd_conv(dout, w_flipped, 2, m)
+  dx = np.ascontiguousarray(dx_padded[:, :, pad:pad + H, pad:pad + W])
+
+  return np.ascontiguousarray(dx), np.ascontiguousarray(dw), db
+
+
+# Maximum number of filter spectra kept by conv_forward_fft
+FFT_FILTER_CACHE_SIZE = 8
+
+_fft_filter_cache = OrderedDict()
+_fft_filter_cache_lock = threading.Lock()
+
+
+def _fft_size(n):
+  """
+  Return the smallest integer >= n whose only prime factors are 2, 3 and 5;
+  FFTs of these sizes are much faster than FFTs of nearby prime sizes.
+  """
+  while True:
+    m = n
+    for p in (2, 3, 5):
+      while m % p == 0:
+        m /= p
+    if m == 1:
+      return n
+    n += 1
+
+
+def _filter_spectrum(w, fft_shape):
+  """
+  Return the real 2D FFT of the filters w, zero-padded to fft_shape, laid out
+  as an array of shape (K, C, F) where K is the number of frequencies.
+
+  Spectra are cached between calls, so repeated forward passes with the same
+  weights (for example when checking accuracy over many minibatches) compute
+  them only once. Each entry keeps a copy of the filters it was computed
+  from, so a stale spectrum is never returned for weights updated in place.
+  """
+  key = (id(w), w.shape, w.dtype.str, fft_shape)
+  with _fft_filter_cache_lock:
+    entry = _fft_filter_cache.pop(key, None)
+    if entry is not None and np.array_equal(entry[0], w):
+      _fft_filter_cache[key] = entry
+      return entry[1]
+
+  F, C = w.shape[:2]
+  w_hat = np.fft.rfft2(w.transpose(2, 3, 1, 0), s=fft_shape, axes=(0, 1))
+  w_hat = w_hat.reshape(-1, C, F)
+
+  with _fft_filter_cache_lock:
+    _fft_filter_cache[key] = (w.copy(), w_hat)
+    while len(_fft_filter_cache) > FFT_FILTER_CACHE_SIZE:
+      _fft_filter_cache.popitem(last=False)
+  return w_hat
+
+
+def clear_fft_filter_cache():
+  """
+  Drop all cached filter spectra.
+  """
+  with _fft_filter_cache_lock:
+    _fft_filter_cache.clear()
+
+
+def _input_spectrum(x, pad, fft_shape):
+  """
+  Return the real 2D FFT of x, zero-padded by pad and then to fft_shape, laid
+  out as an array of shape (K, N, C) where K is the number of frequencies.
+  """
+  N, C, H, W = x.shape
+  H_padded, W_padded = H + 2 * pad, W + 2 * pad
+
+  # Pad the input in (H, W, N, C) layout so the spectrum comes out as (K, N, C)
+  x_padded = workspace.get((H_padded, W_padded, N, C), x.dtype, zero=True)
+  x_padded[pad:pad + H, pad:pad + W] = x.transpose(2, 3, 0, 1)
+  x_hat = np.fft.rfft2(x_padded, s=fft_shape, axes=(0, 1)).reshape(-1, N, C)
+  workspace.release(x_padded)
+  return x_hat
+
+
+def conv_forward_fft(x, w, b, conv_param):
+  """
+  A fast implementation of the forward pass for a convolutional layer based
+  on the FFT. This pays off for large filters such as 5x5 and 7x7, where the
+  cost per output no longer grows with the filter size.
+
+  Images and filters are transformed in one batched FFT each, laid out
+  frequency-major so that the sum over input channels becomes one (N, C) x
+  (C, F) matrix multiply per frequency. Strides greater than 1 are handled by
+  subsampling the stride-1 output.
+  """
+  N, C, H, W = x.shape
+  F, _, HH, WW = w.shape
+  stride, pad = conv_param['stride'], conv_param['pad']
+
+  H_padded, W_padded = H + 2 * pad, W + 2 * pad
+  fft_shape = (_fft_size(H_padded), _fft_size(W_padded))
+
+  x_hat = _input_spectrum(x, pad, fft_shape)
+  w_hat = _filter_spectrum(w, fft_shape)
+
+  # Correlation is multiplication by the conjugate filter spectrum
+  out_hat = _batched_dot(x_hat, w_hat.conj())
+  out_hat = out_hat.reshape(fft_shape[0], -1, N, F)
+  out = np.fft.irfft2(out_hat, s=fft_shape, axes=(0, 1))
+  out = out[:H_padded - HH + 1:stride, :W_padded - WW + 1:stride]
+  out = out.transpose(2, 3, 0, 1) + b.reshape(1, -1, 1, 1)
+  out = np.ascontiguousarray(out, dtype=x.dtype)
+
+  if _low_memory(conv_param):
+    x_hat = None
+  cache = (x, x_hat, w, w_hat, fft_shape, conv_param)
+  return out, cache
+
+
+def conv_backward_fft(dout, cache):
+  """
+  A fast implementation of the backward pass for a convolutional layer based
+  on the FFT, reusing the image and filter spectra from the forward pass.
+  """
+  x, x_hat, w, w_hat, fft_shape, conv_param = cache
+  N, C, H, W = x.shape
+  F, _, HH, WW = w.shape
+  stride, pad = conv_param['stride'], conv_param['pad']
+  if x_hat is None:
+    x_hat = _input_spectrum(x, pad, fft_shape)
+  H_padded, W_padded = H + 2 * pad, W + 2 * pad
+
+  db = np.sum(dout, axis=(0, 2, 3))
+
+  # Scatter dout into the stride-1 output grid, in (H, W, N, F) layout
+  dout_dense = workspace.get((H_padded - HH + 1, W_padded - WW + 1, N, F),
+                             dout.dtype, zero=True)
+  dout_dense[::stride, ::stride] = dout.transpose(2, 3, 0, 1)
+  dout_hat = np.fft.rfft2(dout_dense, s=fft_shape, axes=(0, 1))
+  workspace.release(dout_dense)
+  dout_hat = dout_hat.reshape(-1, N, F)
+
+  # dx is the full convolution of dout with the filters
+  dx_hat = _batched_dot(dout_hat, w_hat.transpose(0, 2, 1))
+  dx = np.fft.irfft2(dx_hat.reshape(fft_shape[0], -1, N, C), s=fft_shape,
+                     axes=(0, 1))
+  dx = dx[pad:pad + H, pad:pad + W].transpose(2, 3, 0, 1)
+  dx = np.ascontiguousarray(dx, dtype=dout.dtype)
+
+  # dw is the correlation of the padded input with dout, summed over images
+  dw_hat = _batched_dot(x_hat.transpose(0, 2, 1), dout_hat.conj())
+  dw = np.fft.irfft2(dw_hat.reshape(fft_shape[0], -1, C, F), s=fft_shape,
+                     axes=(0, 1))
+  dw = np.ascontiguousarray(dw[:HH, :WW].transpose(3, 2, 0, 1), dtype=w.dtype)
+
+  return dx, dw, db
+
+
+# Per-shape selection of the convolution algorithm. The first time
+# conv_forward_autotune sees a layer configuration it times the forward and
+# backward pass of every algorithm below and remembers the fastest; the
+# choices are saved to CONV_AUTOTUNE_FILE so that later runs skip the timing.
+# Set the environment variable CS231N_CONV_ALGORITHM to one of the keys of
+# CONV_ALGORITHMS, or conv_param['algorithm'] for a single layer, to bypass
+# the tuner. The algorithms all work on NCHW data with dense filters; layers
+# with conv_param['layout'] set to 'NHWC' always use conv_forward_nhwc, and
+# layers with conv_param['groups'] > 1 use conv_forward_grouped.
+CONV_ALGORITHMS = OrderedDict([
+  ('strides', (conv_forward_strides, conv_backward_strides, {})),
+  ('im2col', (conv_forward_im2col, conv_backward_im2col, {})),
+  ('winograd2', (conv_forward_winograd, conv_backward_winograd,
+                 {'winograd_tile': 2})),
+  ('winograd4', (conv_forward_winograd, conv_backward_winograd,
+                 {'winograd_tile': 4})),
+  ('fft', (conv_forward_fft, conv_backward_fft, {})),
+  ('threaded', (conv_forward_threaded, conv_backward_threaded, {})),
+])
+
+# Algorithms that the autotuner leaves out for float32 layers, because their
+# rounding error is an order of magnitude larger than that of im2col. They are
+# still used when requested by name.
+CONV_AUTOTUNE_SKIP_FLOAT32 = ('winograd4',)
+
+CONV_AUTOTUNE_FILE = os.environ.get('CS231N_CONV_AUTOTUNE_FILE',
+  os.path.join(os.path.dirname(os.path.abspath(__file__)), 'conv_autotune.pkl'))
+
+_autotune_table = None
+_autotune_lock = threading.Lock()
+
+
+def _load_autotune_table():
+  global _autotune_table
+  if _autotune_table is None:
+    _autotune_table = {}
+    if os.path.isfile(CONV_AUTOTUNE_FILE):
+      try:
+        with open(CONV_AUTOTUNE_FILE, 'rb') as f:
+          _autotune_table = pickle.load(f)
+      except (IOError, EOFError, pickle.UnpicklingError):
+        # An unreadable file only means that layers are tuned again
+        pass
+  return _autotune_table
+
+
+def _save_autotune_table():
+  tmp_filename = CONV_AUTOTUNE_FILE + '.tmp'
+  try:
+    with open(tmp_filename, 'wb') as f:
+      pickle.dump(_autotune_table, f, pickle.HIGHEST_PROTOCOL)
+    os.rename(tmp_filename, CONV_AUTOTUNE_FILE)
+  except (IOError, OSError):
+    # The choices are still kept in memory for this process
+    pass
+
+
+def time_conv_algorithms(x, w, b, conv_param, num_runs=3):
+  """
+  Time the forward and backward pass of every algorithm in CONV_ALGORITHMS,
+  except those in CONV_AUTOTUNE_SKIP_FLOAT32 for float32 inputs.
+
+  Each algorithm is run once untimed first, so that one-off costs such as
+  filling the workspace pool and the FFT filter cache or starting the thread
+  pool are not counted, and is then timed num_runs times.
+
+  Returns a dictionary mapping the name of each algorithm that supports this
+  layer configuration to its fastest time in seconds.
+  """
+  timings = {}
+  for name, (forward, backward, extra) in CONV_ALGORITHMS.iteritems():
+    if x.dtype == np.float32 and name in CONV_AUTOTUNE_SKIP_FLOAT32:
+      continue
+    param = dict(conv_param, **extra)
+    try:
+      out, cache = forward(x, w, b, param)
+    except AssertionError:
+      # The algorithm does not support this layer configuration
+      continue
+    backward(out, cache)
+    times = []
+    for _ in xrange(num_runs):
+      start = timeit.default_timer()
+      out, cache = forward(x, w, b, param)
+      backward(out, cache)
+      times.append(timeit.default_timer() - start)
+    timings[name] = min(times)
+  return timings
+
+
+def select_conv_algorithm(x, w, b, conv_param):
+  """
+  Return the name of the algorithm that conv_forward_autotune uses for a
+  layer, tuning it on these inputs if its configuration has not been seen.
+  Configurations are keyed by the shapes of x and w, stride, pad and dtype.
+  """
+  name = conv_param.get('algorithm') or os.environ.get('CS231N_CONV_ALGORITHM')
+  if name:
+    if name not in CONV_ALGORITHMS:
+      raise ValueError('Unknown convolution algorithm "%s"' % name)
+    return name
+
+  key = (x.shape, w.shape, conv_param['stride'], conv_param['pad'],
+         x.dtype.str)
+  with _autotune_lock:
+    table = _load_autotune_table()
+    name = table.get(key)
+    if name not in CONV_ALGORITHMS:
+      timings = time_conv_algorithms(x, w, b, conv_param)
+      name = min(timings, key=timings.get)
+      table[key] = name
+      _save_autotune_table()
+  return name
+
+
+def conv_autotune_info():
+  """
+  Return a dictionary mapping each tuned layer configuration, given as a
+  tuple (x shape, w shape, stride, pad, dtype), to its algorithm.
+  """
+  with _autotune_lock:
+    return dict(_load_autotune_table())
+
+
+def clear_conv_autotune():
+  """ Forget all tuned layer configurations, including the saved ones """
+  global _autotune_table
+  with _autotune_lock:
+    _autotune_table = {}
+    if os.path.isfile(CONV_AUTOTUNE_FILE):
+      os.remove(CONV_AUTOTUNE_FILE)
+
+
+def conv_forward_autotune(x, w, b, conv_param):
+  """
+  Forward pass for a convolutional layer that dispatches to the fastest
+  algorithm for its configuration; see select_conv_algorithm.
+  """
+  grouped = conv_param.get('groups', 1) > 1
+  if _layout(conv_param) == 'NHWC':
+    if grouped:
+      raise ValueError('Grouped convolutions need the NCHW layout')
+    out, cache = conv_forward_nhwc(x, w, b, conv_param)
+    return out, ('nhwc', cache)
+  if grouped:
+    out, cache = conv_forward_grouped(x, w, b, conv_param)
+    return out, ('grouped', cache)
+  name = select_conv_algorithm(x, w, b, conv_param)
+  forward, _, extra = CONV_ALGORITHMS[name]
+  out, cache = forward(x, w, b, dict(conv_param, **extra))
+  return out, (name, cache)
+
+
+def conv_backward_autotune(dout, cache):
+  """
+  Backward pass for a convolutional layer, using the algorithm that was
+  picked for the forward pass.
+  """
+  name, cache = cache
+  if name == 'nhwc':
+    return conv_backward_nhwc(dout, cache)
+  elif name == 'grouped':
+    return conv_backward_grouped(dout, cache)
+  return CONV_ALGORITHMS[name][1](dout, cache)
+
+
+conv_forward_fast = conv_forward_autotune
+conv_backward_fast = conv_backward_autotune
 
 
 def max_pool_forward_fast(x, pool_param):
   """
   A fast implementation of the forward pass for a max pooling layer.
 
-  This chooses between the reshape method and the im2col method. If the pooling
-  regions are square and tile the input image, then we can use the reshape
-  method which is very fast. Otherwise we fall back on the im2col method, which
-  is not much faster than the naive method.
+  This chooses between the reshape method and the strided method. If the
+  pooling regions are square and tile the input image, then we can use the
+  reshape method which is very fast. Otherwise, for example for overlapping
+  3x3 regions with stride 2, we fall back on the strided method. Channels-last
+  data, with pool_param['layout'] set to 'NHWC', uses max_pool_forward_nhwc.
   """
+  if _layout(pool_param) == 'NHWC':
+    out, nhwc_cache = max_pool_forward_nhwc(x, pool_param)
+    return out, ('nhwc', nhwc_cache)
+
   N, C, H, W = x.shape
   pool_height, pool_width = pool_param['pool_height'], pool_param['pool_width']
   stride = pool_param['stride']
@@ -148,8 +1231,8 @@ def max_pool_forward_fast(x, pool_param):
     out, reshape_cache = max_pool_forward_reshape(x, pool_param)
     cache = ('reshape', reshape_cache)
   else:
-    out, im2col_cache = max_pool_forward_im2col(x, pool_param)
-    cache = ('im2col', im2col_cache)
+    out, strided_cache = max_pool_forward_strided(x, pool_param)
+    cache = ('strided', strided_cache)
   return out, cache
 
 
@@ -157,12 +1240,16 @@ def max_pool_backward_fast(dout, cache):
   """
   A fast implementation of the backward pass for a max pooling layer.
 
-  This switches between the reshape method an the im2col method depending on
-  which method was used to generate the cache.
+  This switches between the reshape, strided, nhwc and im2col methods
+  depending on which method was used to generate the cache.
   """
   method, real_cache = cache
   if method == 'reshape':
     return max_pool_backward_reshape(dout, real_cache)
+  elif method == 'strided':
+    return max_pool_backward_strided(dout, real_cache)
+  elif method == 'nhwc':
+    return max_pool_backward_nhwc(dout, real_cache)
   elif method == 'im2col':
     return max_pool_backward_im2col(dout, real_cache)
   else:
@@ -221,6 +1308,116 @@ def max_pool_backward_reshape(dout, cache):
   return dx
 
 
+def max_pool_forward_strided(x, pool_param):
+  """
+  A fast implementation of the forward pass for max pooling that works for
+  any pooling regions, including overlapping ones.
+
+  The pooling windows are a strided view of x, so nothing is copied; the max
+  is taken tap by tap over the windows, and the cache only keeps the index of
+  the winning tap of each window in the smallest integer type that fits.
+  """
+  N, C, H, W = x.shape
+  pool_height, pool_width = pool_param['pool_height'], pool_param['pool_width']
+  stride = pool_param['stride']
+  out_height = (H - pool_height) / stride + 1
+  out_width = (W - pool_width) / stride + 1
+
+  sN, sC, sH, sW = x.strides
+  windows = np.lib.stride_tricks.as_strided(x,
+              shape=(N, C, out_height, out_width, pool_height, pool_width),
+              strides=(sN, sC, stride * sH, stride * sW, sH, sW))
+
+  out = windows[:, :, :, :, 0, 0].copy()
+  argmax_dtype = np.min_scalar_type(pool_height * pool_width)
+  argmax = np.zeros(out.shape, dtype=argmax_dtype)
+  for k in xrange(1, pool_height * pool_width):
+    tap = windows[:, :, :, :, k / pool_width, k % pool_width]
+    better = tap > out
+    np.copyto(out, tap, where=better)
+    np.copyto(argmax, k, where=better)
+
+  cache = (x.shape, x.dtype, argmax, pool_param)
+  return out, cache
+
+
+def max_pool_backward_strided(dout, cache):
+  """
+  A fast implementation of the backward pass for max pooling, matching
+  max_pool_forward_strided.
+
+  The gradient of each window goes to the flat index of its winning element
+  in x; overlapping windows can share a winner, so the gradients are summed
+  with a single np.bincount.
+  """
+  x_shape, dtype, argmax, pool_param = cache
+  N, C, H, W = x_shape
+  pool_width = pool_param['pool_width']
+  stride = pool_param['stride']
+  _, _, out_height, out_width = dout.shape
+
+  argmax = argmax.astype(np.intp)
+  window_dy, window_dx = argmax / pool_width, argmax % pool_width
+  flat_idx = (np.arange(N * C).reshape(N, C, 1, 1) * (H * W) +
+              (np.arange(out_height) * stride * W).reshape(-1, 1) +
+              np.arange(out_width) * stride +
+              window_dy * W + window_dx)
+  dx = np.bincount(flat_idx.ravel(), weights=dout.ravel(),
+                   minlength=N * C * H * W)
+  return dx.reshape(x_shape).astype(dtype, copy=False)
+
+
+def max_pool_forward_nhwc(x, pool_param):
+  """
+  The strided max pooling of max_pool_forward_strided for channels-last data:
+  x has shape (N, H, W, C) and the output has shape (N, H', W', C).
+  """
+  N, H, W, C = x.shape
+  pool_height, pool_width = pool_param['pool_height'], pool_param['pool_width']
+  stride = pool_param['stride']
+  out_height = (H - pool_height) / stride + 1
+  out_width = (W - pool_width) / stride + 1
+
+  sN, sH, sW, sC = x.strides
+  windows = np.lib.stride_tricks.as_strided(x,
+              shape=(N, out_height, out_width, pool_height, pool_width, C),
+              strides=(sN, stride * sH, stride * sW, sH, sW, sC))
+
+  out = windows[:, :, :, 0, 0].copy()
+  argmax_dtype = np.min_scalar_type(pool_height * pool_width)
+  argmax = np.zeros(out.shape, dtype=argmax_dtype)
+  for k in xrange(1, pool_height * pool_width):
+    tap = windows[:, :, :, k / pool_width, k % pool_width]
+    better = tap > out
+    np.copyto(out, tap, where=better)
+    np.copyto(argmax, k, where=better)
+
+  cache = (x.shape, x.dtype, argmax, pool_param)
+  return out, cache
+
+
+def max_pool_backward_nhwc(dout, cache):
+  """
+  The backward pass for max pooling on channels-last data, matching
+  max_pool_forward_nhwc.
+  """
+  x_shape, dtype, argmax, pool_param = cache
+  N, H, W, C = x_shape
+  pool_width = pool_param['pool_width']
+  stride = pool_param['stride']
+  _, out_height, out_width, _ = dout.shape
+
+  argmax = argmax.astype(np.intp)
+  window_dy, window_dx = argmax / pool_width, argmax % pool_width
+  flat_idx = (np.arange(N).reshape(N, 1, 1, 1) * (H * W * C) +
+              (np.arange(out_height) * stride * W * C).reshape(-1, 1, 1) +
+              (np.arange(out_width) * stride * C).reshape(-1, 1) +
+              np.arange(C) + (window_dy * W + window_dx) * C)
+  dx = np.bincount(flat_idx.ravel(), weights=dout.ravel(),
+                   minlength=N * H * W * C)
+  return dx.reshape(x_shape).astype(dtype, copy=False)
+
+
 def max_pool_forward_im2col(x, pool_param):
   """
   An implementation of the forward pass for max pooling based on im2col.
@@ -239,7 +1436,8 @@ def max_pool_forward_im2col(x, pool_param):
   out_width = (W - pool_width) / stride + 1
 
   x_split = x.reshape(N * C, 1, H, W)
-  x_cols = im2col(x_split, pool_height, pool_width, padding=0, stride=stride)
+  x_cols = im2col_indices(x_split, pool_height, pool_width, padding=0,
+                          stride=stride)
   x_cols_argmax = np.argmax(x_cols, axis=0)
   x_cols_max = x_cols[x_cols_argmax, np.arange(x_cols.shape[1])]
   out = x_cols_max.reshape(out_height, out_width, N, C).transpose(2, 3, 0, 1)
@@ -261,10 +1459,115 @@ def max_pool_backward_im2col(dout, cache):
   stride = pool_param['stride']
 
   dout_reshaped = dout.transpose(2, 3, 0, 1).flatten()
-  dx_cols = np.zeros_like(x_cols)
+  dx_cols = workspace.get(x_cols.shape, x_cols.dtype, zero=True)
   dx_cols[x_cols_argmax, np.arange(dx_cols.shape[1])] = dout_reshaped
   dx = col2im_indices(dx_cols, (N * C, 1, H, W), pool_height, pool_width,
               padding=0, stride=stride)
+  workspace.release(dx_cols)
   dx = dx.reshape(x.shape)
 
   return dx
+
+
+def conv_relu_pool_forward_fast(x, w, b, conv_param, pool_param):
+  """
+  A fused implementation of the forward pass for a convolution, a ReLU and a
+  max pool.
+
+  The convolution is computed with im2col; the ReLU is applied in place to
+  the output of the matrix multiply and the pooling windows are read straight
+  out of that matrix, so the cache holds x_cols, the argmax of each pooling
+  window and which pooled outputs are positive instead of the full
+  activations. The fused path needs NCHW data, filters without groups and
+  square pooling regions that tile the conv output, as in
+  max_pool_forward_reshape; otherwise the three layers are run one after the
+  other, with pooling in the layout of the convolution.
+  """
+  N, C, H, W = x.shape
+  F, _, HH, WW = w.shape
+  stride, pad = conv_param['stride'], conv_param['pad']
+  pool_height, pool_width = pool_param['pool_height'], pool_param['pool_width']
+
+  conv_fits = ((H + 2 * pad - HH) % stride == 0 and
+               (W + 2 * pad - WW) % stride == 0)
+  out_height = (H + 2 * pad - HH) / stride + 1
+  out_width = (W + 2 * pad - WW) / stride + 1
+  same_size = pool_height == pool_width == pool_param['stride']
+  tiles = out_height % pool_height == 0 and out_width % pool_width == 0
+  dense = _layout(conv_param) == 'NCHW' and conv_param.get('groups', 1) == 1
+  if not (dense and conv_fits and same_size and tiles):
+    a, conv_cache = conv_forward_fast(x, w, b, conv_param)
+    relu_mask = a > 0
+    a *= relu_mask
+    pool_param = dict(pool_param, layout=_layout(conv_param))
+    out, pool_cache = max_pool_forward_fast(a, pool_param)
+    cache = ('unfused', (conv_cache, relu_mask, pool_cache))
+    return out, cache
+
+  x_cols = im2col_cython_parallel(x, HH, WW, pad, stride)
+  res = _dot_into_workspace(w.reshape(F, -1), x_cols)
+  res += b.reshape(-1, 1)
+  np.maximum(res, 0, out=res)
+
+  # res is laid out as (F, out_height, out_width, N); take the running max
+  # over the taps of each pooling window, remembering which tap won
+  a = res.reshape(F, out_height / pool_height, pool_height,
+                  out_width / pool_width, pool_width, N)
+  pooled = a[:, :, 0, :, 0].copy()
+  argmax_dtype = np.min_scalar_type(pool_height * pool_width)
+  argmax = np.zeros(pooled.shape, dtype=argmax_dtype)
+  for k in xrange(1, pool_height * pool_width):
+    tap = a[:, :, k / pool_width, :, k % pool_width]
+    better = tap > pooled
+    np.copyto(pooled, tap, where=better)
+    np.copyto(argmax, k, where=better)
+  workspace.release(res)
+
+  out = np.ascontiguousarray(pooled.transpose(3, 0, 1, 2))
+  if _low_memory(conv_param):
+    x_cols = None
+  cache = ('fused', (x, x_cols, w, conv_param, pool_param, argmax,
+                     pooled > 0))
+  return out, cache
+
+
+def conv_relu_pool_backward_fast(dout, cache):
+  """
+  A fused implementation of the backward pass for a convolution, a ReLU and
+  a max pool, matching conv_relu_pool_forward_fast.
+  """
+  method, real_cache = cache
+  if method == 'unfused':
+    conv_cache, relu_mask, pool_cache = real_cache
+    da = max_pool_backward_fast(dout, pool_cache)
+    da *= relu_mask
+    return conv_backward_fast(da, conv_cache)
+  elif method != 'fused':
+    raise ValueError('Unrecognized method "%s"' % method)
+
+  x, x_cols, w, conv_param, pool_param, argmax, positive = real_cache
+  N, C, H, W = x.shape
+  F, _, HH, WW = w.shape
+  stride, pad = conv_param['stride'], conv_param['pad']
+  if x_cols is None:
+    x_cols = im2col_cython_parallel(x, HH, WW, pad, stride)
+  pool_height, pool_width = pool_param['pool_height'], pool_param['pool_width']
+  _, pooled_height, pooled_width, _ = argmax.shape
+
+  # Only the winning tap of a window with a positive output gets a gradient
+  dpooled = dout.transpose(1, 2, 3, 0) * positive
+  db = np.sum(dpooled, axis=(1, 2, 3))
+
+  da = workspace.get((F, pooled_height, pool_height, pooled_width, pool_width,
+                      N), dout.dtype, zero=True)
+  for k in xrange(pool_height * pool_width):
+    np.copyto(da[:, :, k / pool_width, :, k % pool_width], dpooled,
+              where=(argmax == k))
+
+  da_cols = da.reshape(F, -1)
+  dw = da_cols.dot(x_cols.T).reshape(w.shape)
+  dx_cols = _dot_into_workspace(w.reshape(F, -1).T, da_cols)
+  dx = col2im_cython_parallel(dx_cols, N, C, H, W, HH, WW, pad, stride)
+  workspace.release(da, dx_cols)
+
+  return dx, dw, db
@@ -63,7 +63,8 @@ def conv_relu_backward(dout, cache):
 
 def conv_relu_pool_forward(x, w, b, conv_param, pool_param):
   """
-  Convenience layer that performs a convolution, a ReLU, and a pool.
+  Convenience layer that performs a convolution, a ReLU, and a pool. The
+  three layers are fused; see conv_relu_pool_forward_fast.
 
   Inputs:
   - x: Input to the convolutional layer
@@ -74,20 +75,12 @@ def conv_relu_pool_forward(x, w, b, conv_param, pool_param):
   - out: Output from the pooling layer
   - cache: Object to give to the backward pass
   """
-  a, conv_cache = conv_forward_fast(x, w, b, conv_param)
-  s, relu_cache = relu_forward(a)
-  out, pool_cache = max_pool_forward_fast(s, pool_param)
-  cache = (conv_cache, relu_cache, pool_cache)
-  return out, cache
+  return conv_relu_pool_forward_fast(x, w, b, conv_param, pool_param)
 
 
 def conv_relu_pool_backward(dout, cache):
   """
   Backward pass for the conv-relu-pool convenience layer
   """
-  conv_cache, relu_cache, pool_cache = cache
-  ds = max_pool_backward_fast(dout, pool_cache)
-  da = relu_backward(ds, relu_cache)
-  dx, dw, db = conv_backward_fast(da, conv_cache)
-  return dx, dw, db
+  return conv_relu_pool_backward_fast(dout, cache)
 
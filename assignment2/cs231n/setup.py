@@ -1,11 +1,49 @@
+import os
+import shutil
+import tempfile
+from distutils.ccompiler import new_compiler
 from distutils.core import setup
+from distutils.errors import CompileError, LinkError
 from distutils.extension import Extension
+from distutils.sysconfig import customize_compiler
 from Cython.Build import cythonize
 import numpy
 
+
+def openmp_flags():
+  """
+  Return the compiler flags needed to build with OpenMP, or an empty list if
+  the C compiler cannot build an OpenMP program. Without OpenMP the parallel
+  kernels in im2col_cython.pyx still build and just run serially.
+  """
+  tmp_dir = tempfile.mkdtemp()
+  try:
+    src = os.path.join(tmp_dir, 'check_openmp.c')
+    with open(src, 'w') as f:
+      f.write('#include <omp.h>\n'
+              'int main(void) { return omp_get_max_threads() < 1; }\n')
+    compiler = new_compiler()
+    customize_compiler(compiler)
+    flags = ['-fopenmp']
+    try:
+      objects = compiler.compile([src], output_dir=tmp_dir,
+                                 extra_postargs=flags)
+      compiler.link_executable(objects, os.path.join(tmp_dir, 'check_openmp'),
+                               extra_postargs=flags)
+    except (CompileError, LinkError):
+      print 'OpenMP is not available; the parallel kernels will run serially'
+      return []
+    return flags
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+flags = openmp_flags()
 extensions = [
   Extension('im2col_cython', ['im2col_cython.pyx'],
-            include_dirs = [numpy.get_include()]
+            include_dirs = [numpy.get_include()],
+            extra_compile_args = flags,
+            extra_link_args = flags,
   ),
 ]
 
@@ -1,6 +1,7 @@
 import numpy as np
 
 from cs231n import optim
+from cs231n.data_loader import MinibatchLoader
 
 
 class Solver(object):
@@ -95,6 +96,13 @@ class Solver(object):
     - batch_size: Size of minibatches used to compute loss and gradient during
       training.
     - num_epochs: The number of epochs to run for during training.
+    - num_prefetch: Number of minibatches to gather ahead of time in a
+      background thread (see data_loader.MinibatchLoader). If 0, each
+      minibatch is gathered on the training thread.
+    - augment: Optional function applied to each training minibatch X_batch,
+      such as an augmentation.Augmenter. It may modify X_batch in place and
+      must return an array of the same shape; when num_prefetch > 0 it runs
+      in the background thread.
     - print_every: Integer; training losses will be printed every print_every
       iterations.
     - verbose: Boolean; if set to false then no output will be printed during
@@ -112,6 +120,8 @@ class Solver(object):
     self.lr_decay = kwargs.pop('lr_decay', 1.0)
     self.batch_size = kwargs.pop('batch_size', 100)
     self.num_epochs = kwargs.pop('num_epochs', 10)
+    self.num_prefetch = kwargs.pop('num_prefetch', 0)
+    self.augment = kwargs.pop('augment', None)
 
     self.print_every = kwargs.pop('print_every', 10)
     self.verbose = kwargs.pop('verbose', True)
@@ -142,6 +152,7 @@ class Solver(object):
     self.loss_history = []
     self.train_acc_history = []
     self.val_acc_history = []
+    self.loader = None
 
     # Make a deep copy of the optim_config for each parameter
     self.optim_configs = {}
@@ -156,10 +167,15 @@ class Solver(object):
     be called manually.
     """
     # Make a minibatch of training data
-    num_train = self.X_train.shape[0]
-    batch_mask = np.random.choice(num_train, self.batch_size)
-    X_batch = self.X_train[batch_mask]
-    y_batch = self.y_train[batch_mask]
+    if self.loader is not None:
+      X_batch, y_batch = self.loader.next_batch()
+    else:
+      num_train = self.X_train.shape[0]
+      batch_mask = np.random.choice(num_train, self.batch_size)
+      X_batch = self.X_train[batch_mask]
+      y_batch = self.y_train[batch_mask]
+      if self.augment is not None:
+        X_batch = self.augment(X_batch)
 
     # Compute loss and gradient
     loss, grads = self.model.loss(X_batch, y_batch)
@@ -223,43 +239,54 @@ class Solver(object):
     iterations_per_epoch = max(num_train / self.batch_size, 1)
     num_iterations = self.num_epochs * iterations_per_epoch
 
-    for t in xrange(num_iterations):
-      self._step()
-
-      # Maybe print training loss
-      if self.verbose and t % self.print_every == 0:
-        print '(Iteration %d / %d) loss: %f' % (
-               t + 1, num_iterations, self.loss_history[-1])
-
-      # At the end of every epoch, increment the epoch counter and decay the
-      # learning rate.
-      epoch_end = (t + 1) % iterations_per_epoch == 0
-      if epoch_end:
-        self.epoch += 1
-        for k in self.optim_configs:
-          self.optim_configs[k]['learning_rate'] *= self.lr_decay
-
-      # Check train and val accuracy on the first iteration, the last
-      # iteration, and at the end of each epoch.
-      first_it = (t == 0)
-      last_it = (t == num_iterations + 1)
-      if first_it or last_it or epoch_end:
-        train_acc = self.check_accuracy(self.X_train, self.y_train,
-                                        num_samples=1000)
-        val_acc = self.check_accuracy(self.X_val, self.y_val)
-        self.train_acc_history.append(train_acc)
-        self.val_acc_history.append(val_acc)
-
-        if self.verbose:
-          print '(Epoch %d / %d) train acc: %f; val_acc: %f' % (
-                 self.epoch, self.num_epochs, train_acc, val_acc)
-
-        # Keep track of the best model
-        if val_acc > self.best_val_acc:
-          self.best_val_acc = val_acc
-          self.best_params = {}
-          for k, v in self.model.params.iteritems():
-            self.best_params[k] = v.copy()
+    if self.num_prefetch > 0:
+      self.loader = MinibatchLoader(self.X_train, self.y_train,
+                                    self.batch_size,
+                                    num_prefetch=self.num_prefetch,
+                                    transform=self.augment)
+
+    try:
+      for t in xrange(num_iterations):
+        self._step()
+
+        # Maybe print training loss
+        if self.verbose and t % self.print_every == 0:
+          print '(Iteration %d / %d) loss: %f' % (
+                 t + 1, num_iterations, self.loss_history[-1])
+
+        # At the end of every epoch, increment the epoch counter and decay the
+        # learning rate.
+        epoch_end = (t + 1) % iterations_per_epoch == 0
+        if epoch_end:
+          self.epoch += 1
+          for k in self.optim_configs:
+            self.optim_configs[k]['learning_rate'] *= self.lr_decay
+
+        # Check train and val accuracy on the first iteration, the last
+        # iteration, and at the end of each epoch.
+        first_it = (t == 0)
+        last_it = (t == num_iterations + 1)
+        if first_it or last_it or epoch_end:
+          train_acc = self.check_accuracy(self.X_train, self.y_train,
+                                          num_samples=1000)
+          val_acc = self.check_accuracy(self.X_val, self.y_val)
+          self.train_acc_history.append(train_acc)
+          self.val_acc_history.append(val_acc)
+
+          if self.verbose:
+            print '(Epoch %d / %d) train acc: %f; val_acc: %f' % (
+                   self.epoch, self.num_epochs, train_acc, val_acc)
+
+          # Keep track of the best model
+          if val_acc > self.best_val_acc:
+            self.best_val_acc = val_acc
+            self.best_params = {}
+            for k, v in self.model.params.iteritems():
+              self.best_params[k] = v.copy()
+    finally:
+      if self.loader is not None:
+        self.loader.close()
+        self.loader = None
 
     # At the end of training swap the best params into the model
     self.model.params = self.best_params
@@ -0,0 +1,125 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class WorkspacePool(object):
+  """
+  A WorkspacePool hands out scratch arrays and keeps them for reuse once they
+  are released, so that layers which need large temporary buffers on every
+  call (im2col matrices, padded inputs, gradients of columns) do not allocate
+  and free them on every iteration.
+
+  Buffers are keyed by shape and dtype. Released buffers are kept up to a
+  total of max_bytes; beyond that the least recently released ones are
+  dropped. Only buffers that are no longer referenced anywhere else may be
+  released; the pool does not track buffers while they are in use.
+
+  Example usage:
+
+  buf = workspace.get((C * HH * WW, N * out_h * out_w), x.dtype)
+  ... use buf ...
+  workspace.release(buf)
+  """
+
+  def __init__(self, max_bytes=256 << 20):
+    """
+    Construct a new WorkspacePool.
+
+    Inputs:
+    - max_bytes: Maximum number of bytes of released buffers to keep. 0
+      disables reuse, so get() always allocates.
+    """
+    self.max_bytes = max_bytes
+    self._free = OrderedDict()
+    self._free_bytes = 0
+    self._lock = threading.Lock()
+    self._stats = {'requests': 0, 'reuses': 0, 'in_use_bytes': 0,
+                   'peak_bytes': 0}
+
+
+  def get(self, shape, dtype=np.float64, zero=False):
+    """
+    Return a C-contiguous array of the given shape and dtype, reusing a
+    released buffer if one is available.
+
+    Inputs:
+    - shape: Shape of the array.
+    - dtype: Data type of the array.
+    - zero: If True the array is filled with zeros; otherwise its contents
+      are undefined.
+    """
+    dtype = np.dtype(dtype)
+    key = (tuple(shape), dtype.str)
+    buf = None
+    with self._lock:
+      self._stats['requests'] += 1
+      buffers = self._free.get(key)
+      if buffers:
+        buf = buffers.pop()
+        if not buffers:
+          del self._free[key]
+        self._free_bytes -= buf.nbytes
+        self._stats['reuses'] += 1
+      if buf is not None:
+        nbytes = buf.nbytes
+      else:
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+      self._stats['in_use_bytes'] += nbytes
+      held_bytes = self._stats['in_use_bytes'] + self._free_bytes
+      self._stats['peak_bytes'] = max(self._stats['peak_bytes'], held_bytes)
+
+    if buf is None:
+      if zero:
+        return np.zeros(shape, dtype=dtype)
+      return np.empty(shape, dtype=dtype)
+    if zero:
+      buf.fill(0)
+    return buf
+
+
+  def release(self, *arrays):
+    """
+    Give arrays obtained from get() back to the pool. The caller must not use
+    them afterwards.
+    """
+    with self._lock:
+      for a in arrays:
+        in_use_bytes = self._stats['in_use_bytes'] - a.nbytes
+        self._stats['in_use_bytes'] = max(0, in_use_bytes)
+        if a.nbytes > self.max_bytes:
+          continue
+        key = (a.shape, a.dtype.str)
+        self._free.setdefault(key, []).append(a)
+        # Move the key to the end so that eviction drops the oldest first
+        self._free[key] = self._free.pop(key)
+        self._free_bytes += a.nbytes
+      while self._free_bytes > self.max_bytes:
+        key, buffers = self._free.popitem(last=False)
+        self._free_bytes -= sum(b.nbytes for b in buffers)
+
+
+  def stats(self):
+    """
+    Return a dictionary with the number of requests, how many of them reused
+    a buffer, the bytes currently handed out and currently kept for reuse,
+    and the peak of their sum.
+    """
+    with self._lock:
+      stats = dict(self._stats)
+      stats['free_bytes'] = self._free_bytes
+    return stats
+
+
+  def clear(self):
+    """ Drop all released buffers and reset the statistics """
+    with self._lock:
+      self._free.clear()
+      self._free_bytes = 0
+      for k in self._stats:
+        self._stats[k] = 0
+
+
+# The pool used by the layers in fast_layers
+workspace = WorkspacePool()
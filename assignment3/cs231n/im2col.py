@@ -1,7 +1,67 @@
+import threading
+from collections import OrderedDict
+
 import numpy as np
 
 
+# Index tables only depend on the layer geometry, which is the same on every
+# iteration, so get_im2col_indices keeps the most recently used ones in a
+# bounded LRU cache.
+IM2COL_INDEX_CACHE_SIZE = 64
+_index_cache = OrderedDict()
+_index_cache_lock = threading.Lock()
+_index_cache_stats = {'hits': 0, 'misses': 0}
+
+
 def get_im2col_indices(x_shape, field_height, field_width, padding=1, stride=1):
+  """
+  Return the fancy-index arrays (k, i, j) used by im2col_indices. The arrays
+  are read-only and shared between calls with the same geometry; the batch
+  size N does not matter, so it is not part of the cache key.
+  """
+  key = (tuple(x_shape[1:]), field_height, field_width, padding, stride)
+  with _index_cache_lock:
+    indices = _index_cache.pop(key, None)
+    if indices is not None:
+      _index_cache_stats['hits'] += 1
+      _index_cache[key] = indices
+      return indices
+    _index_cache_stats['misses'] += 1
+
+  indices = _compute_im2col_indices(x_shape, field_height, field_width,
+                                    padding, stride)
+  for a in indices:
+    a.flags.writeable = False
+
+  with _index_cache_lock:
+    _index_cache[key] = indices
+    while len(_index_cache) > IM2COL_INDEX_CACHE_SIZE:
+      _index_cache.popitem(last=False)
+  return indices
+
+
+def im2col_index_cache_info():
+  """
+  Return a dictionary with the number of cache hits and misses of
+  get_im2col_indices, the current number of cached entries and the maximum.
+  """
+  with _index_cache_lock:
+    info = dict(_index_cache_stats)
+    info['size'] = len(_index_cache)
+  info['max_size'] = IM2COL_INDEX_CACHE_SIZE
+  return info
+
+
+def clear_im2col_index_cache():
+  """ Drop all cached index tables and reset the hit and miss counters """
+  with _index_cache_lock:
+    _index_cache.clear()
+    _index_cache_stats['hits'] = 0
+    _index_cache_stats['misses'] = 0
+
+
+def _compute_im2col_indices(x_shape, field_height, field_width, padding=1,
+                            stride=1):
   # First figure out what the size of the output should be
   N, C, H, W = x_shape
   assert (H + 2 * padding - field_height) % stride == 0
@@ -39,17 +99,63 @@ def im2col_indices(x, field_height, field_width, padding=1, stride=1):
 
 def col2im_indices(cols, x_shape, field_height=3, field_width=3, padding=1,
                    stride=1):
-  """ An implementation of col2im based on fancy indexing and np.add.at """
+  """
+  An implementation of col2im for the output of im2col_indices. Rather than
+  scattering with fancy indexing and np.add.at, which is unbuffered and very
+  slow, it adds one strided slice per filter tap; see col2im_strided.
+  """
   N, C, H, W = x_shape
-  H_padded, W_padded = H + 2 * padding, W + 2 * padding
-  x_padded = np.zeros((N, C, H_padded, W_padded), dtype=cols.dtype)
-  k, i, j = get_im2col_indices(x_shape, field_height, field_width, padding,
-                               stride)
-  cols_reshaped = cols.reshape(C * field_height * field_width, -1, N)
-  cols_reshaped = cols_reshaped.transpose(2, 0, 1)
-  np.add.at(x_padded, (slice(None), k, i, j), cols_reshaped)
-  if padding == 0:
-    return x_padded
-  return x_padded[:, :, padding:-padding, padding:-padding]
+  return col2im_strided(cols, N, C, H, W, field_height, field_width, padding,
+                        stride)
 
 pass
+
+
+# Pure numpy versions of the kernels in im2col_cython.pyx, with the same
+# signatures and layouts. fast_layers falls back to these when the Cython
+# extension has not been built. Both directions work on strided views of the
+# padded input; col2im adds one strided slice per filter tap instead of
+# scattering with np.add.at, so every update is a vectorized, buffered add.
+
+def im2col_strided(x, field_height, field_width, padding=1, stride=1):
+  """ An implementation of im2col_cython based on a strided window view """
+  N, C, H, W = x.shape
+  out_height = (H + 2 * padding - field_height) / stride + 1
+  out_width = (W + 2 * padding - field_width) / stride + 1
+
+  p = padding
+  x_padded = np.pad(x, ((0, 0), (0, 0), (p, p), (p, p)), mode='constant')
+  sN, sC, sH, sW = x_padded.strides
+  windows = np.lib.stride_tricks.as_strided(x_padded,
+              shape=(C, field_height, field_width, out_height, out_width, N),
+              strides=(sC, sH, sW, stride * sH, stride * sW, sN))
+  return np.ascontiguousarray(windows).reshape(C * field_height * field_width,
+                                               -1)
+
+
+def col2im_6d_strided(cols, N, C, H, W, HH, WW, pad, stride):
+  """
+  An implementation of col2im_6d_cython based on strided slice sums; cols
+  has shape (C, HH, WW, N, out_h, out_w).
+  """
+  out_h = (H + 2 * pad - HH) / stride + 1
+  out_w = (W + 2 * pad - WW) / stride + 1
+  x_padded = np.zeros((N, C, H + 2 * pad, W + 2 * pad), dtype=cols.dtype)
+  for hh in xrange(HH):
+    for ww in xrange(WW):
+      tap = cols[:, hh, ww].transpose(1, 0, 2, 3)
+      x_padded[:, :, hh:hh + stride * out_h:stride,
+               ww:ww + stride * out_w:stride] += tap
+  if pad > 0:
+    return x_padded[:, :, pad:-pad, pad:-pad]
+  return x_padded
+
+
+def col2im_strided(cols, N, C, H, W, field_height, field_width, padding,
+                   stride):
+  """ An implementation of col2im_cython based on strided slice sums """
+  out_height = (H + 2 * padding - field_height) / stride + 1
+  out_width = (W + 2 * padding - field_width) / stride + 1
+  cols = cols.reshape(C, field_height, field_width, out_height, out_width, N)
+  return col2im_6d_strided(cols.transpose(0, 1, 2, 5, 3, 4), N, C, H, W,
+                           field_height, field_width, padding, stride)
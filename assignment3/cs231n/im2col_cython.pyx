@@ -1,6 +1,7 @@
 import numpy as np
 cimport numpy as np
 cimport cython
+from cython.parallel import prange
 
 # DTYPE = np.float64
 # ctypedef np.float64_t DTYPE_t
@@ -36,6 +37,7 @@ def im2col_cython(np.ndarray[DTYPE_t, ndim=4] x, int field_height,
 
 
 @cython.boundscheck(False)
+@cython.wraparound(False)
 cdef int im2col_cython_inner(np.ndarray[DTYPE_t, ndim=2] cols,
                              np.ndarray[DTYPE_t, ndim=4] x_padded,
                              int N, int C, int H, int W, int HH, int WW,
@@ -72,6 +74,7 @@ def col2im_cython(np.ndarray[DTYPE_t, ndim=2] cols, int N, int C, int H, int W,
 
 
 @cython.boundscheck(False)
+@cython.wraparound(False)
 cdef int col2im_cython_inner(np.ndarray[DTYPE_t, ndim=2] cols,
                              np.ndarray[DTYPE_t, ndim=4] x_padded,
                              int N, int C, int H, int W, int HH, int WW,
@@ -118,4 +121,149 @@ def col2im_6d_cython(np.ndarray[DTYPE_t, ndim=6] cols, int N, int C, int H, int
 
     if pad > 0:
         return x_padded[:, :, pad:-pad, pad:-pad]
-    return x_padded 
+    return x_padded
+
+
+# Parallel versions of the kernels above. They run with the GIL released and
+# split the work over OpenMP threads with prange; if the extension is built
+# without OpenMP (see setup.py) the same loops simply run serially. Padding is
+# handled implicitly by bounds checks instead of materializing x_padded.
+#
+# im2col parallelizes over rows of cols, and the col2im kernels over (n, c)
+# pairs, so no two threads ever write to the same element.
+#
+# The inputs are const memoryviews so that read-only arrays (such as memory-
+# mapped batches) are accepted. Cython cannot declare const memoryviews of a
+# fused type built from the numpy typedefs, so these kernels use FLOAT_t,
+# which is made of the same C types as DTYPE_t.
+
+ctypedef fused FLOAT_t:
+    float
+    double
+
+
+def im2col_cython_parallel(const FLOAT_t[:, :, :, :] x, int field_height,
+                           int field_width, int padding, int stride):
+    cdef int N = x.shape[0]
+    cdef int C = x.shape[1]
+    cdef int H = x.shape[2]
+    cdef int W = x.shape[3]
+
+    cdef int HH = (H + 2 * padding - field_height) / stride + 1
+    cdef int WW = (W + 2 * padding - field_width) / stride + 1
+
+    cols = np.empty((C * field_height * field_width, N * HH * WW),
+                    dtype=np.asarray(x).dtype)
+    cdef FLOAT_t[:, ::1] cols_view = cols
+
+    im2col_parallel_inner(cols_view, x, N, C, H, W, HH, WW,
+                          field_height, field_width, padding, stride)
+    return cols
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void im2col_parallel_inner(FLOAT_t[:, ::1] cols,
+                                const FLOAT_t[:, :, :, :] x,
+                                int N, int C, int H, int W, int HH, int WW,
+                                int field_height, int field_width,
+                                int padding, int stride) nogil:
+    cdef int c, ii, jj, row, yy, xx, i, col, y, xp
+
+    for row in prange(C * field_height * field_width, schedule='static'):
+        c = row / (field_height * field_width)
+        ii = (row / field_width) % field_height
+        jj = row % field_width
+        for yy in range(HH):
+            y = stride * yy + ii - padding
+            for xx in range(WW):
+                xp = stride * xx + jj - padding
+                col = (yy * WW + xx) * N
+                if y < 0 or y >= H or xp < 0 or xp >= W:
+                    for i in range(N):
+                        cols[row, col + i] = 0
+                else:
+                    for i in range(N):
+                        cols[row, col + i] = x[i, c, y, xp]
+
+
+def col2im_cython_parallel(const FLOAT_t[:, :] cols, int N, int C, int H,
+                           int W, int field_height, int field_width,
+                           int padding, int stride):
+    cdef int HH = (H + 2 * padding - field_height) / stride + 1
+    cdef int WW = (W + 2 * padding - field_width) / stride + 1
+
+    x = np.zeros((N, C, H, W), dtype=np.asarray(cols).dtype)
+    cdef FLOAT_t[:, :, :, ::1] x_view = x
+
+    col2im_parallel_inner(cols, x_view, N, C, H, W, HH, WW,
+                          field_height, field_width, padding, stride)
+    return x
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void col2im_parallel_inner(const FLOAT_t[:, :] cols,
+                                FLOAT_t[:, :, :, ::1] x,
+                                int N, int C, int H, int W, int HH, int WW,
+                                int field_height, int field_width,
+                                int padding, int stride) nogil:
+    cdef int nc, n, c, ii, jj, row, yy, xx, y, xp
+
+    for nc in prange(N * C, schedule='static'):
+        n = nc / C
+        c = nc % C
+        for ii in range(field_height):
+            for jj in range(field_width):
+                row = (c * field_height + ii) * field_width + jj
+                for yy in range(HH):
+                    y = stride * yy + ii - padding
+                    if y < 0 or y >= H:
+                        continue
+                    for xx in range(WW):
+                        xp = stride * xx + jj - padding
+                        if xp < 0 or xp >= W:
+                            continue
+                        x[n, c, y, xp] += cols[row, (yy * WW + xx) * N + n]
+
+
+def col2im_6d_cython_parallel(const FLOAT_t[:, :, :, :, :, :] cols, int N,
+                              int C, int H, int W, int HH, int WW, int pad,
+                              int stride):
+    cdef int out_h = (H + 2 * pad - HH) / stride + 1
+    cdef int out_w = (W + 2 * pad - WW) / stride + 1
+
+    x = np.zeros((N, C, H, W), dtype=np.asarray(cols).dtype)
+    cdef FLOAT_t[:, :, :, ::1] x_view = x
+
+    col2im_6d_parallel_inner(cols, x_view, N, C, H, W, HH, WW,
+                             out_h, out_w, pad, stride)
+    return x
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void col2im_6d_parallel_inner(const FLOAT_t[:, :, :, :, :, :] cols,
+                                   FLOAT_t[:, :, :, ::1] x,
+                                   int N, int C, int H, int W, int HH, int WW,
+                                   int out_h, int out_w, int pad,
+                                   int stride) nogil:
+    cdef int nc, n, c, hh, ww, h, w, y, xp
+
+    for nc in prange(N * C, schedule='static'):
+        n = nc / C
+        c = nc % C
+        for hh in range(HH):
+            for ww in range(WW):
+                for h in range(out_h):
+                    y = stride * h + hh - pad
+                    if y < 0 or y >= H:
+                        continue
+                    for w in range(out_w):
+                        xp = stride * w + ww - pad
+                        if xp < 0 or xp >= W:
+                            continue
+                        x[n, c, y, xp] += cols[c, hh, ww, n, h, w]
@@ -48,7 +48,7 @@ def affine_bn_relu_forward(x, w, b, gamma, beta, bn_param):
   - cache: Object to give to the backward pass.
   """
   a, fc_cache = affine_forward(x, w, b)
-  a_bn, bn_cache = batchnorm_forward(a, gamma, beta, bn_param)
+  a_bn, bn_cache = batchnorm_forward_fused(a, gamma, beta, bn_param)
   out, relu_cache = relu_forward(a_bn)
   cache = (fc_cache, bn_cache, relu_cache)
   return out, cache
@@ -60,7 +60,8 @@ def affine_bn_relu_backward(dout, cache):
   """
   fc_cache, bn_cache, relu_cache = cache
   da_bn = relu_backward(dout, relu_cache)
-  da, dgamma, dbeta = batchnorm_backward(da_bn, bn_cache)
+  # da_bn is a new array, so batchnorm can overwrite it with its gradient
+  da, dgamma, dbeta = batchnorm_backward_fused(da_bn, bn_cache, in_place=True)
   dx, dw, db = affine_backward(da, fc_cache)
   return dx, dw, db, dgamma, dbeta  
 
@@ -111,7 +112,8 @@ def conv_bn_relu_backward(dout, cache):
 
 def conv_relu_pool_forward(x, w, b, conv_param, pool_param):
   """
-  Convenience layer that performs a convolution, a ReLU, and a pool.
+  Convenience layer that performs a convolution, a ReLU, and a pool. The
+  three layers are fused; see conv_relu_pool_forward_fast.
 
   Inputs:
   - x: Input to the convolutional layer
@@ -122,20 +124,12 @@ def conv_relu_pool_forward(x, w, b, conv_param, pool_param):
   - out: Output from the pooling layer
   - cache: Object to give to the backward pass
   """
-  a, conv_cache = conv_forward_fast(x, w, b, conv_param)
-  s, relu_cache = relu_forward(a)
-  out, pool_cache = max_pool_forward_fast(s, pool_param)
-  cache = (conv_cache, relu_cache, pool_cache)
-  return out, cache
+  return conv_relu_pool_forward_fast(x, w, b, conv_param, pool_param)
 
 
 def conv_relu_pool_backward(dout, cache):
   """
   Backward pass for the conv-relu-pool convenience layer
   """
-  conv_cache, relu_cache, pool_cache = cache
-  ds = max_pool_backward_fast(dout, pool_cache)
-  da = relu_backward(ds, relu_cache)
-  dx, dw, db = conv_backward_fast(da, conv_cache)
-  return dx, dw, db
+  return conv_relu_pool_backward_fast(dout, cache)
 
@@ -201,6 +201,127 @@ def batchnorm_backward(dout, cache):
   return dx, dgamma, dbeta
 
 
+def batchnorm_forward_fused(x, gamma, beta, bn_param):
+  """
+  Forward pass for batch normalization that computes the same output and
+  running averages as batchnorm_forward with fewer full-size temporaries and
+  a smaller cache.
+
+  The centered data x - mean is computed once. The variance is reduced from
+  it with einsum, without squaring into a temporary, and the centered data
+  is then normalized in place to give x_hat. The cache keeps only x_hat and
+  the per-feature inverse standard deviation (and gamma), which is all that
+  batchnorm_backward_fused needs; x itself is not kept.
+
+  Inputs / outputs: Same as batchnorm_forward
+  """
+  N, D = x.shape
+  out, cache = _batchnorm_forward_channels(x.reshape(N, D, 1), gamma, beta,
+                                           bn_param)
+  return out.reshape(N, D), cache
+
+
+def batchnorm_backward_fused(dout, cache, in_place=False):
+  """
+  Backward pass for batch normalization, matching batchnorm_forward_fused.
+
+  It uses the closed-form gradient
+
+  dx = gamma * inv_std * (dout - mean(dout) - x_hat * mean(dout * x_hat))
+
+  where the two means over the minibatch are dbeta / N and dgamma / N, so the
+  whole backward pass is two reductions and a few elementwise updates.
+
+  Inputs:
+  - dout: Upstream derivatives, of shape (N, D)
+  - cache: Variable of intermediates from batchnorm_forward_fused.
+  - in_place: If True, dx is written into dout and the cached x_hat is used
+    as scratch space, so no full-size array is allocated; dout and the cache
+    must not be used afterwards.
+
+  Returns a tuple of:
+  - dx: Gradient with respect to inputs x, of shape (N, D)
+  - dgamma: Gradient with respect to scale parameter gamma, of shape (D,)
+  - dbeta: Gradient with respect to shift parameter beta, of shape (D,)
+  """
+  N, D = dout.shape
+  dx, dgamma, dbeta = _batchnorm_backward_channels(dout.reshape(N, D, 1),
+                                                   cache, in_place)
+  return dx.reshape(N, D), dgamma, dbeta
+
+
+def _batchnorm_forward_channels(x, gamma, beta, bn_param):
+  """
+  The computation of batchnorm_forward_fused for x of shape (A, C, B),
+  normalizing each channel c over axes 0 and 2. Vanilla batch normalization
+  passes x as (N, D, 1) and spatial batch normalization as (N, C, H * W) or
+  (N * H * W, C, 1), which are all views, so no layout is ever transposed;
+  the per-channel statistics broadcast with shape (C, 1).
+  """
+  mode = bn_param['mode']
+  eps = bn_param.get('eps', 1e-5)
+  momentum = bn_param.get('momentum', 0.9)
+
+  A, C, B = x.shape
+  running_mean = bn_param.get('running_mean', np.zeros(C, dtype=x.dtype))
+  running_var = bn_param.get('running_var', np.zeros(C, dtype=x.dtype))
+
+  if mode == 'train':
+    mu = x.mean(axis=(0, 2))
+    x_hat = x - mu[:, np.newaxis]
+    var = np.einsum('acb,acb->c', x_hat, x_hat) / (A * B)
+    running_mean = momentum * running_mean + (1 - momentum) * mu
+    running_var = momentum * running_var + (1 - momentum) * var
+  elif mode == 'test':
+    x_hat = x - running_mean[:, np.newaxis]
+    var = running_var
+  else:
+    raise ValueError('Invalid forward batchnorm mode "%s"' % mode)
+
+  inv_std = 1.0 / np.sqrt(var + eps)
+  x_hat *= inv_std[:, np.newaxis]
+  out = x_hat * gamma[:, np.newaxis]
+  out += beta[:, np.newaxis]
+
+  # Store the updated running means back into bn_param
+  bn_param['running_mean'] = running_mean
+  bn_param['running_var'] = running_var
+
+  cache = (mode, x_hat, gamma, inv_std)
+  return out, cache
+
+
+def _batchnorm_backward_channels(dout, cache, in_place=False):
+  """
+  The computation of batchnorm_backward_fused for dout of shape (A, C, B),
+  matching _batchnorm_forward_channels.
+  """
+  mode, x_hat, gamma, inv_std = cache
+  A, C, B = dout.shape
+  M = A * B
+
+  dbeta = dout.sum(axis=(0, 2))
+  dgamma = np.einsum('acb,acb->c', dout, x_hat)
+  scale = (gamma * inv_std)[:, np.newaxis]
+
+  if mode == 'test':
+    # The running averages are constants, so only the scale remains
+    dx = np.multiply(dout, scale, out=dout if in_place else None)
+    return dx, dgamma, dbeta
+
+  if in_place:
+    x_hat *= (dgamma / M)[:, np.newaxis]
+    x_hat += (dbeta / M)[:, np.newaxis]
+    dx = np.subtract(dout, x_hat, out=dout)
+  else:
+    dx = x_hat * (dgamma / M)[:, np.newaxis]
+    dx += (dbeta / M)[:, np.newaxis]
+    np.subtract(dout, dx, out=dx)
+  dx *= scale
+
+  return dx, dgamma, dbeta
+
+
 def spatial_batchnorm_forward(x, gamma, beta, bn_param):
   """
   Computes the forward pass for spatial batch normalization.
@@ -218,15 +339,23 @@ def spatial_batchnorm_forward(x, gamma, beta, bn_param):
       default of momentum=0.9 should work well in most situations.
     - running_mean: Array of shape (D,) giving running mean of features
     - running_var Array of shape (D,) giving running variance of features
+    - layout: 'NCHW' (the default) or 'NHWC'. Channels-last data of shape
+      (N, H, W, C) is normalized without any transposes.
     
   Returns a tuple of:
-  - out: Output data, of shape (N, C, H, W)
+  - out: Output data, of the same shape as x
   - cache: Values needed for the backward pass
   """
-  N, C, H, W = x.shape
-  x_flat = x.transpose(0, 2, 3, 1).reshape(-1, C)
-  out_flat, cache = batchnorm_forward(x_flat, gamma, beta, bn_param)
-  out = out_flat.reshape(N, H, W, C).transpose(0, 3, 1, 2)
+  layout = bn_param.get('layout', 'NCHW')
+  if layout == 'NHWC':
+    # Channels are already last, so flattening the other axes is free
+    x_channels = x.reshape(-1, x.shape[3], 1)
+  else:
+    # Normalize over axes (0, 2, 3) of the NCHW data, without transposes
+    x_channels = x.reshape(x.shape[0], x.shape[1], -1)
+  out, cache = _batchnorm_forward_channels(x_channels, gamma, beta, bn_param)
+  out = out.reshape(x.shape)
+  cache = (layout, cache)
   return out, cache
 
 
@@ -235,18 +364,22 @@ def spatial_batchnorm_backward(dout, cache):
   Computes the backward pass for spatial batch normalization.
   
   Inputs:
-  - dout: Upstream derivatives, of shape (N, C, H, W)
+  - dout: Upstream derivatives, of shape (N, C, H, W), or (N, H, W, C) if the
+    forward pass used the NHWC layout
   - cache: Values from the forward pass
   
   Returns a tuple of:
-  - dx: Gradient with respect to inputs, of shape (N, C, H, W)
+  - dx: Gradient with respect to inputs, of the same shape as dout
   - dgamma: Gradient with respect to scale parameter, of shape (C,)
   - dbeta: Gradient with respect to shift parameter, of shape (C,)
   """
-  N, C, H, W = dout.shape
-  dout_flat = dout.transpose(0, 2, 3, 1).reshape(-1, C)
-  dx_flat, dgamma, dbeta = batchnorm_backward(dout_flat, cache)
-  dx = dx_flat.reshape(N, H, W, C).transpose(0, 3, 1, 2)
+  layout, cache = cache
+  if layout == 'NHWC':
+    dout_channels = dout.reshape(-1, dout.shape[3], 1)
+  else:
+    dout_channels = dout.reshape(dout.shape[0], dout.shape[1], -1)
+  dx, dgamma, dbeta = _batchnorm_backward_channels(dout_channels, cache)
+  dx = dx.reshape(dout.shape)
   return dx, dgamma, dbeta
 
 